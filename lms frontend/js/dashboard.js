@@ -49,7 +49,8 @@ document.addEventListener("DOMContentLoaded", async () => {
 });
 
 async function loadDashboardData(accessToken) {
-  const response = await fetch("http://127.0.0.1:8000/api/book-requests/", {
+  // counters kept by the server; no need to download every request to count them
+  const response = await fetch("http://127.0.0.1:8000/api/stats/", {
     method: "GET",
     headers: {
       "Authorization": `Bearer ${accessToken}`
@@ -59,21 +60,15 @@ async function loadDashboardData(accessToken) {
   const data = await response.json();
 
   if (!response.ok) {
-    throw new Error(data.message || "Failed to fetch book requests.");
+    throw new Error(data.message || "Failed to fetch stats.");
   }
 
-  const requests = data.data;
-  let approved = 0;
-  let returned = 0;
-
-  requests.forEach(r => {
-    if (r.is_approved) approved++;
-    if (r.is_returned) returned++;
-  });
+  const counts = data.data.student;
+  const approved = counts.borrowed + counts.returned;
 
   document.getElementById("approvedCount").textContent = approved;
-  document.getElementById("returnedCount").textContent = returned;
-  document.getElementById("totalRequests").textContent = requests.length;
+  document.getElementById("returnedCount").textContent = counts.returned;
+  document.getElementById("totalRequests").textContent = counts.pending + approved;
 }
 
 
@@ -1 +0,0 @@
-default_app_config = 'library.apps.YourAppConfig'
@@ -1,13 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.utils import timezone
+from django.db import transaction
+from . import loans
 from .models import (
     CustomUser,
     StudentProfile,
     Stream,
     Author,
     Book,
-    BookRequest
+    BookRequest,
+    BookRequestArchive
 )
 
 
@@ -29,17 +31,17 @@ class CustomUserAdmin(UserAdmin):
 # ✅ StudentProfile Admin
 @admin.register(StudentProfile)
 class StudentProfileAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'stream', 'is_approved']
+    list_display = ['id', 'user', 'stream', 'is_approved', 'overdue_count']
+    list_select_related = ['user', 'stream']
     search_fields = ['id', 'user__username']
     readonly_fields = ['id']
 
     def approve_students(self, request, queryset):
-        for profile in queryset:
-            profile.is_approved = True
-            profile.user.is_active = True
-            profile.user.save()
-            profile.save()
-        self.message_user(request, "Selected students approved.")
+        # two UPDATEs for the whole selection instead of two saves per student
+        with transaction.atomic():
+            CustomUser.objects.filter(pk__in=queryset.values('user_id')).update(is_active=True)
+            approved = queryset.update(is_approved=True)
+        self.message_user(request, f"{approved} student(s) approved.")
 
     approve_students.short_description = "Approve selected students"
     actions = [approve_students]
@@ -71,20 +73,19 @@ class BookRequestAdmin(admin.ModelAdmin):
         'id', 'student', 'book', 'is_approved', 'requested_at',
         'approved_at','is_overdue_display', 'return_due_date', 'is_returned', 'returned_at'
     )
-    list_filter = ('is_approved', 'is_returned', 'book')
+    list_filter = ('is_approved', 'is_returned', 'waitlisted', 'book')
+    list_select_related = ('student', 'book')
     search_fields = ('student__user__username', 'book__title')
     actions = ['approve_selected_requests']
 
     def approve_selected_requests(self, request, queryset):
-        for book_request in queryset.filter(is_approved=False):
-            if book_request.book.quantity > 0:
-                book_request.is_approved = True
-                book_request.approved_at = timezone.now()
-                book_request.return_due_date = book_request.approved_at + timezone.timedelta(days=7)
-                book_request.book.quantity -= 1
-                book_request.book.save()
-                book_request.save()
-        self.message_user(request, "Selected requests approved where possible.")
+        pks = list(queryset.filter(is_approved=False).values_list('pk', flat=True))
+        approved = 0
+        for start in range(0, len(pks), loans.bulk_max()):
+            results = loans.bulk_approve(pks[start:start + loans.bulk_max()], user=request.user)
+            approved += sum(r['success'] for r in results)
+        self.message_user(request, f"{approved} request(s) approved; the rest were already approved, "
+                                   "claimed by another librarian or out of stock.")
     approve_selected_requests.short_description = "Approve selected book requests"
 
 
@@ -92,3 +93,11 @@ class BookRequestAdmin(admin.ModelAdmin):
         return obj.is_overdue
     is_overdue_display.boolean = True
     is_overdue_display.short_description = "Overdue?"
+
+
+
+@admin.register(BookRequestArchive)
+class BookRequestArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'book', 'requested_at', 'returned_at', 'was_overdue', 'archived_at')
+    list_select_related = ('student', 'book')
+    search_fields = ('student__user__username', 'book__title')
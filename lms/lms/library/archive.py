@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import stats
+from .models import BookRequest, BookRequestArchive
+
+# ----------------------------
+# Archiving returned requests
+# ----------------------------
+# Returned loans are history: only a student's own list ever reads them
+# again, while every hot query (open requests, overdue loans, queues) works
+# on unreturned rows. `archive_returned` moves loans returned more than
+# LIBRARY_ARCHIVE_AFTER_DAYS ago into BookRequestArchive, keeping their ids,
+# one batch per transaction, so the active table only grows with the number
+# of open and recent loans. Readers that want history query both tables
+# (see filter_book_requests and KeysetPaginator).
+
+ARCHIVED_FIELDS = [
+    'id', 'student_id', 'book_id', 'is_approved', 'requested_at', 'approved_at',
+    'return_due_date', 'is_returned', 'returned_at', 'was_overdue',
+]
+
+
+def archive_after():
+    return timedelta(days=getattr(settings, "LIBRARY_ARCHIVE_AFTER_DAYS", 180))
+
+
+def batch_size():
+    return getattr(settings, "LIBRARY_ARCHIVE_BATCH", 1000)
+
+
+def archivable(older_than=None):
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_after())
+    return BookRequest.objects.filter(is_returned=True, returned_at__lt=cutoff)
+
+
+def archive_returned(older_than=None, size=None):
+    """Move returned requests older than `older_than` into the archive. Returns how many moved."""
+    size = size or batch_size()
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                archivable(older_than).select_for_update(skip_locked=True)
+                .order_by('returned_at', 'id').values(*ARCHIVED_FIELDS)[:size]
+            )
+            if not rows:
+                return moved
+            BookRequestArchive.objects.bulk_create(BookRequestArchive(**row) for row in rows)
+            with stats.keeping_counts():  # still counted, from the archive
+                BookRequest.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
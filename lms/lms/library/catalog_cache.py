@@ -0,0 +1,144 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# ----------------------------
+# Versioned catalog response cache
+# ----------------------------
+# Book list responses are cached under keys that embed generation counters:
+#   books        bumped by any Book change (the unfiltered list)
+#   stream:<id>  bumped by a Book change in that stream (?stream=<id> lists)
+#   meta         bumped by Author/Stream changes (names shown on every book)
+#   index:<name> bumped by any change to an in-process catalog index, so
+#                the other workers know to rebuild theirs
+# Bumping a counter orphans every key built from the old value, so nothing
+# has to be deleted; orphans just age out. Use a shared cache backend in
+# production so all workers see the same counters.
+
+PREFIX = "library:catalog"
+
+
+def get_cache():
+    return caches[getattr(settings, "LIBRARY_CATALOG_CACHE", "default")]
+
+
+def _timeout():
+    return getattr(settings, "LIBRARY_CATALOG_CACHE_TIMEOUT", 300)
+
+
+def _fresh_generation():
+    # never restart at 1 after an eviction, or old keys would come back to life
+    return time.time_ns()
+
+
+def _generation_keys(stream):
+    keys = [f"{PREFIX}:gen:meta"]
+    keys.append(f"{PREFIX}:gen:stream:{stream}" if stream != "all" else f"{PREFIX}:gen:books")
+    return keys
+
+
+def _generations(keys):
+    cache = get_cache()
+    values = cache.get_many(keys)
+    missing = {key: _fresh_generation() for key in keys if key not in values}
+    if missing:
+        for key, value in missing.items():
+            # add() so two workers starting a counter at once agree on it
+            if not cache.add(key, value, timeout=None):
+                value = cache.get(key, value)
+            values[key] = value
+    return [values[key] for key in keys]
+
+
+def _bump(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_generation(), timeout=None)
+
+
+def bump_books(*stream_ids):
+    """Invalidate the unfiltered list and the lists of the given streams, after commit."""
+    keys = [f"{PREFIX}:gen:books"]
+    keys += [f"{PREFIX}:gen:stream:{stream_id}" for stream_id in set(stream_ids) if stream_id is not None]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def bump_meta():
+    """Invalidate every cached list (author or stream names changed), after commit."""
+    transaction.on_commit(lambda: _bump([f"{PREFIX}:gen:meta"]))
+
+
+def index_generation(name):
+    """Shared generation of the in-process index `name` (library/search.py, library/suggest.py)."""
+    return _generations([f"{PREFIX}:gen:index:{name}"])[0]
+
+
+def bump_index(name):
+    """Bump index `name`'s generation now and return the new value."""
+    cache, key = get_cache(), f"{PREFIX}:gen:index:{name}"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        value = _fresh_generation()
+        cache.set(key, value, timeout=None)
+        return value
+
+
+def normalized_params(request):
+    params = request.query_params
+    stream = params.get("stream", "").strip().lower() or "all"
+    search = " ".join(params.get("search", "").lower().split())
+    extra = sorted(
+        (name, params.get(name))
+        for name in ("cursor", "page_size", "ordering", "facets")
+        if name in params
+    )
+    return stream, search, extra
+
+
+def book_list_key(request):
+    if not hasattr(request, "_catalog_cache_key"):
+        stream, search, extra = normalized_params(request)
+        generations = _generations(_generation_keys(stream))
+        raw = repr((stream, search, extra, generations))
+        request._catalog_cache_key = f"{PREFIX}:books:{hashlib.sha1(raw.encode()).hexdigest()}"
+    return request._catalog_cache_key
+
+
+def lookup(key):
+    value = get_cache().get(key)
+    _count("hits" if value is not None else "misses")
+    return value
+
+
+def store(key, value):
+    get_cache().set(key, value, timeout=_timeout())
+
+
+def _count(name):
+    cache = get_cache()
+    key = f"{PREFIX}:stats:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([f"{PREFIX}:stats:hits", f"{PREFIX}:stats:misses"])
+    hits = values.get(f"{PREFIX}:stats:hits", 0)
+    misses = values.get(f"{PREFIX}:stats:misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
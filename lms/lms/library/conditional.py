@@ -0,0 +1,77 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from . import catalog_cache
+
+# ----------------------------
+# Conditional GET (ETag / Last-Modified)
+# ----------------------------
+# Validators come from one aggregate query (row counts + newest timestamps)
+# over the same queryset the view would serialize, so a matching
+# If-None-Match / If-Modified-Since gets a 304 without serializing anything.
+# Counts are part of the ETag so deletes change it even when no remaining
+# row is newer; Last-Modified alone can't see deletes, which is why
+# If-None-Match takes precedence when a client sends both.
+
+
+def aggregate_validators(queryset, timestamps, counts=()):
+    aggregates = {"rows": Count("pk")}
+    for i, field in enumerate(counts):
+        aggregates[f"count_{i}"] = Count(field)
+    for i, field in enumerate(timestamps):
+        aggregates[f"max_{i}"] = Max(field)
+    values = queryset.order_by().aggregate(**aggregates)
+
+    stamps = [values[f"max_{i}"] for i in range(len(timestamps)) if values[f"max_{i}"] is not None]
+    last_modified = max(stamps) if stamps else None
+    digest = hashlib.sha1(repr(sorted(values.items())).encode()).hexdigest()
+    return f'W/"{digest}"', last_modified
+
+
+def conditional_get(get_queryset, timestamps, counts=(), cache_key=None):
+    """
+    Decorates an APIView `get`. `get_queryset(request, *args, **kwargs)`
+    returns the rows the response is built from. With `cache_key` (a
+    versioned catalog cache key function) the validators are cached too, so
+    a revalidation hit needs no query at all.
+    """
+    def compute(request, *args, **kwargs):
+        queryset = get_queryset(request, *args, **kwargs)
+        return aggregate_validators(queryset, timestamps, counts)
+
+    def validators(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately; aggregate once
+        if not hasattr(request, "_conditional_validators"):
+            if cache_key is None:
+                request._conditional_validators = compute(request, *args, **kwargs)
+            else:
+                key = f"{cache_key(request, *args, **kwargs)}:validators"
+                cached = catalog_cache.get_cache().get(key)
+                if cached is None:
+                    cached = compute(request, *args, **kwargs)
+                    catalog_cache.store(key, cached)
+                request._conditional_validators = cached
+        return request._conditional_validators
+
+    conditional = condition(
+        etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1],
+    )
+
+    def decorator(view):
+        view = conditional(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            # let browsers keep the response but revalidate it on every load
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+
+    return method_decorator(decorator)
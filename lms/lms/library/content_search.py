@@ -0,0 +1,186 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .models import Book, BookPage, BookTerm
+from .search import tokenize
+
+# ----------------------------
+# Search inside book PDFs
+# ----------------------------
+# The extracted page text (BookPage) is indexed into BookTerm: one row per
+# (term, book) holding the book's total count for the term and the pages it
+# occurs on. A query fetches only the rows of its own terms through the
+# (term, book) index and never reads page text, except for the few pages it
+# builds snippets from.
+#
+# Ranking runs in two steps. All matching books are scored on term
+# frequency (idf * (1 + log tf), scaled by the share of query terms
+# matched). Only the best candidates then have their page lists decoded,
+# and books where the terms share a page are boosted.
+# A book is re-indexed whenever its PDF is processed again.
+#
+# Terms are folded (case and accents dropped, as MySQL's default collation
+# compares them) on the way in and on the way out, so "café" and "cafe" are
+# one term, one row under the (term, book) unique key, and match each other.
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+MAX_TERM_LENGTH = BookTerm._meta.get_field("term").max_length
+MAX_QUERY_TERMS = 8
+SNIPPET_RADIUS = 80
+
+
+def fold(text):
+    """`text` without case or accents."""
+    return "".join(c for c in unicodedata.normalize("NFKD", text.casefold()) if not unicodedata.combining(c))
+
+
+def index_terms(text):
+    terms = (fold(t) for t in tokenize(text))
+    return [t for t in terms if 1 < len(t) <= MAX_TERM_LENGTH and t not in STOPWORDS]
+
+
+def index_book(book_id, pages):
+    """Replace the index of `book_id` with the terms of `pages`, an iterable of (number, text)."""
+    postings = defaultdict(dict)  # term -> {page: count}
+    for number, text in pages:
+        for term, count in Counter(index_terms(text)).items():
+            postings[term][number] = count
+
+    BookTerm.objects.filter(book_id=book_id).delete()
+    BookTerm.objects.bulk_create(
+        (
+            BookTerm(
+                term=term, book_id=book_id, tf=sum(counts.values()),
+                pages=",".join(f"{page}:{count}" for page, count in sorted(counts.items())),
+            )
+            for term, counts in postings.items()
+        ),
+        batch_size=1000,
+    )
+    return len(postings)
+
+
+def remove_book(book_id):
+    BookTerm.objects.filter(book_id=book_id).delete()
+
+
+def decode_pages(pages):
+    return {int(page): int(count) for page, count in (item.split(":") for item in pages.split(","))}
+
+
+def page_texts(pages_by_book):
+    """{(book_id, number): text} for the given pages, in one query."""
+    pairs = [(book_id, number) for book_id, numbers in pages_by_book.items() for number in numbers]
+    if not pairs:
+        return {}
+    # `(book_id = %s AND number IN (...)) OR ...` as one raw condition: the
+    # same tree of Q objects costs more to compile than the query takes to run
+    qn = connection.ops.quote_name
+    table, book_col, number_col = qn(BookPage._meta.db_table), qn("book_id"), qn("number")
+    clauses, params = [], []
+    for book_id, numbers in pages_by_book.items():
+        if numbers:
+            placeholders = ", ".join(["%s"] * len(numbers))
+            clauses.append(f"({table}.{book_col} = %s AND {table}.{number_col} IN ({placeholders}))")
+            params += [book_id, *numbers]
+    condition = RawSQL(" OR ".join(clauses), params, output_field=BooleanField())
+    rows = BookPage.objects.filter(condition).values_list("book_id", "number", "text")
+    return {(book_id, number): text for book_id, number, text in rows}
+
+
+def find_term(text, pattern):
+    """(start, end) in `text` of the first folded term `pattern` matches, or None."""
+    if text.isascii():
+        match = pattern.search(text)
+        return match and match.span()
+    # match the folded text, mapping each folded character back to its source
+    folded, origin = [], []
+    for i, c in enumerate(text):
+        f = fold(c)
+        folded.append(f)
+        origin += [i] * len(f)
+    match = pattern.search("".join(folded))
+    return match and (origin[match.start()], origin[match.end() - 1] + 1)
+
+
+def snippet(text, pattern):
+    span = find_term(text, pattern)
+    if not span:
+        return " ".join(text[:2 * SNIPPET_RADIUS].split())
+    start = max(span[0] - SNIPPET_RADIUS, 0)
+    end = min(span[1] + SNIPPET_RADIUS, len(text))
+    body = " ".join(text[start:end].split())
+    return ("…" if start else "") + body + ("…" if end < len(text) else "")
+
+
+def search(query, limit=None, pages_per_book=3):
+    limit = limit or getattr(settings, "LIBRARY_CONTENT_SEARCH_LIMIT", 20)
+    terms = list(dict.fromkeys(index_terms(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    rows = list(BookTerm.objects.filter(term__in=terms).values_list("term", "book_id", "tf"))
+    if not rows:
+        return []
+    total_books = Book.objects.filter(pdf_status=Book.PDF_READY).count() or 1
+    df = Counter(term for term, _, _ in rows)
+    idf = {term: math.log(1 + total_books / df[term]) for term in df}
+
+    scores, matched = defaultdict(float), defaultdict(int)
+    for term, book_id, tf in rows:
+        scores[book_id] += idf[term] * (1 + math.log(tf))
+        matched[book_id] += 1
+    for book_id in scores:
+        scores[book_id] *= (matched[book_id] / len(terms)) ** 2
+
+    # only the leading candidates are worth decoding page lists for
+    candidates = heapq.nlargest(limit * 3, scores, key=scores.get)
+    page_hits = defaultdict(lambda: defaultdict(lambda: [0, 0]))  # book -> page -> [terms, count]
+    for term, book_id, pages in BookTerm.objects.filter(term__in=terms, book_id__in=candidates).values_list(
+        "term", "book_id", "pages"
+    ):
+        for page, count in decode_pages(pages).items():
+            hit = page_hits[book_id][page]
+            hit[0] += 1
+            hit[1] += count
+
+    best_pages = {}
+    for book_id in candidates:
+        ranked = sorted(page_hits[book_id].items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        best_pages[book_id] = [page for page, _ in ranked[:pages_per_book]]
+        if ranked and ranked[0][1][0] == len(terms) > 1:
+            scores[book_id] *= 1.5  # every term on one page
+
+    top = heapq.nlargest(limit, candidates, key=scores.get)
+    books = Book.objects.filter(pk__in=top).values("id", "title", "author__name", "page_count")
+    books = {b["id"]: b for b in books}
+    texts = page_texts({book_id: best_pages[book_id] for book_id in top})
+
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE)
+    results = []
+    for book_id in top:
+        book = books.get(book_id)
+        if book is None:
+            continue
+        results.append({
+            "book": book_id,
+            "title": book["title"],
+            "author_name": book["author__name"],
+            "page_count": book["page_count"],
+            "score": round(scores[book_id], 4),
+            "matches": [
+                {"page": page, "snippet": snippet(texts.get((book_id, page), ""), pattern)}
+                for page in best_pages[book_id]
+            ],
+        })
+    return results
@@ -0,0 +1,156 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+
+# ----------------------------
+# Protected file downloads (Book.pdf)
+# ----------------------------
+# Access is checked by the view; this module only moves bytes. With
+# LIBRARY_PDF_OFFLOAD set, the transfer is handed to the front server
+# (nginx X-Accel-Redirect / Apache X-Sendfile), which also does Range
+# itself. Otherwise the file is streamed in chunks from storage, honouring
+# a single `Range: bytes=` range and `If-Range`.
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+SIGNING_SALT = "library.book-pdf"
+
+
+# ---- signed links ----
+# Download links are opened by the browser in a new tab, which can't send
+# the JWT header, so pdf_url carries a short-lived signature instead.
+
+def sign_download(book_id, user_id):
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(f"{book_id}:{user_id}")
+
+
+def unsign_download(token, book_id):
+    """User id the token was issued to, or None if it is invalid, expired or for another book."""
+    max_age = getattr(settings, "LIBRARY_PDF_LINK_MAX_AGE", 3600)
+    try:
+        value = signing.TimestampSigner(salt=SIGNING_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    signed_book, _, user_id = value.partition(":")
+    if signed_book != str(book_id) or not user_id.isdigit():
+        return None
+    return int(user_id)
+
+
+# ---- serving ----
+
+def file_validators(storage, name, size):
+    try:
+        modified = storage.get_modified_time(name)
+    except (NotImplementedError, OSError):
+        modified = None
+    stamp = int(modified.timestamp() * 1_000_000) if modified else 0
+    # strong validator, so it can be used with If-Range
+    return quote_etag(f"{size:x}-{stamp:x}"), modified
+
+
+def parse_range(header, size):
+    """(start, end) inclusive, None for no/ignored range, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None  # absent, multi-range or malformed: send the whole file
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def range_is_current(request, etag, modified):
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag  # strong comparison only
+    since = parse_http_date_safe(if_range)
+    return bool(modified and since is not None and int(modified.timestamp()) <= since)
+
+
+def iter_file(fileobj, start, length, chunk_size):
+    try:
+        fileobj.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = fileobj.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+def offload_response(storage, name, content_type, disposition):
+    mode = getattr(settings, "LIBRARY_PDF_OFFLOAD", None)
+    if mode == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, "LIBRARY_PDF_ACCEL_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = prefix + name
+    elif mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = storage.path(name)
+    else:
+        return None
+    response["Content-Disposition"] = disposition
+    return response
+
+
+def serve_file(request, fieldfile, download_name=None):
+    storage, name = fieldfile.storage, fieldfile.name
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    download_name = download_name or os.path.basename(name)
+    disposition = content_disposition_header(False, download_name)
+
+    response = offload_response(storage, name, content_type, disposition)
+    if response is not None:
+        return response
+
+    size = storage.size(name)
+    etag, modified = file_validators(storage, name, size)
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == "*"):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    byte_range = parse_range(request.META.get("HTTP_RANGE"), size) if range_is_current(request, etag, modified) else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    chunk_size = getattr(settings, "LIBRARY_DOWNLOAD_CHUNK_SIZE", 64 * 1024)
+    response = StreamingHttpResponse(
+        iter_file(storage.open(name, "rb"), start, length, chunk_size),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(length)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if modified:
+        response["Last-Modified"] = http_date(modified.timestamp())
+    response["Content-Disposition"] = disposition
+    response["Cache-Control"] = "private"
+    return response
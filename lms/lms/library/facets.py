@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+# ----------------------------
+# Catalog facets
+# ----------------------------
+# Two grouped aggregates over the filtered book queryset: per stream (which
+# also yields the availability split) and per author. Counts are books
+# (titles), availability is by Book.quantity.
+
+
+def book_facets(queryset):
+    books = queryset.order_by()  # ordering columns would leak into GROUP BY
+
+    streams = []
+    available = out_of_stock = 0
+    rows = (
+        books.values('stream_id', 'stream__name')
+        .annotate(count=Count('id'), available=Count('id', filter=Q(quantity__gt=0)))
+        .order_by('-count', 'stream__name')
+    )
+    for row in rows:
+        available += row['available']
+        out_of_stock += row['count'] - row['available']
+        streams.append({"id": row['stream_id'], "name": row['stream__name'], "count": row['count']})
+
+    limit = getattr(settings, 'LIBRARY_FACET_AUTHOR_LIMIT', 50)
+    authors = [
+        {"id": row['author_id'], "name": row['author__name'], "count": row['count']}
+        for row in (
+            books.values('author_id', 'author__name')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'author__name')[:limit]
+        )
+    ]
+
+    return {
+        "stream": streams,
+        "author": authors,
+        "availability": {"available": available, "out_of_stock": out_of_stock},
+    }
@@ -0,0 +1,252 @@
+import csv
+import json
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import catalog_cache, loans
+from .models import Author, Book, Stream
+from .search import get_search_backend
+from .suggest import get_suggest_index
+
+# ----------------------------
+# Bulk book import (CSV / NDJSON)
+# ----------------------------
+# Rows are parsed lazily and handled a chunk at a time: authors and streams
+# are resolved with one query each (missing ones bulk-created), existing
+# books are found by their unique key in one query, then new books are
+# bulk-created and existing ones bulk-updated. Only one chunk is ever held
+# in memory, whatever the size of the upload.
+
+FIELDS = ('title', 'author', 'stream', 'publication_date', 'quantity')
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+REQUIRED_COLUMNS = ('title', 'author', 'publication_date')
+
+
+def iter_lines(fileobj):
+    """Decoded lines from a binary file object (an upload or an open file), read in chunks."""
+    for n, line in enumerate(fileobj):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8-sig' if n == 0 else 'utf-8')
+            except UnicodeDecodeError:
+                raise ImportFormatError(f"Line {n + 1} is not UTF-8 text.")
+        yield line
+
+
+def iter_records(fileobj, fmt):
+    lines = iter_lines(fileobj)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            columns = [f.strip() for f in reader.fieldnames or []]
+            missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+            if missing:
+                raise ImportFormatError(
+                    f"CSV header must include {', '.join(repr(n) for n in REQUIRED_COLUMNS)}; "
+                    f"missing {', '.join(repr(n) for n in missing)}."
+                )
+            for record in reader:
+                yield {(k or '').strip(): v for k, v in record.items()}
+        except csv.Error as exc:
+            raise ImportFormatError(f"Malformed CSV at line {reader.line_num}: {exc}")
+    elif fmt == 'ndjson':
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else line
+    else:
+        raise ImportFormatError(f"Unsupported format '{fmt}'. Use 'csv' or 'ndjson'.")
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def clean_record(record):
+    if not isinstance(record, dict):
+        raise ValueError("Line is not a JSON object.")
+    title = str(record.get('title') or '').strip()
+    author = str(record.get('author') or '').strip()
+    stream = str(record.get('stream') or '').strip() or None
+    if not title:
+        raise ValueError("'title' is required.")
+    if len(title) > Book._meta.get_field('title').max_length:
+        raise ValueError("'title' is too long.")
+    if not author:
+        raise ValueError("'author' is required.")
+    if len(author) > Author._meta.get_field('name').max_length:
+        raise ValueError("'author' is too long.")
+    if stream and len(stream) > Stream._meta.get_field('name').max_length:
+        raise ValueError("'stream' is too long.")
+    try:
+        publication_date = date.fromisoformat(str(record.get('publication_date') or '').strip())
+    except ValueError:
+        raise ValueError("'publication_date' must be YYYY-MM-DD.")
+    quantity = record.get('quantity')
+    try:
+        quantity = int(quantity) if quantity not in (None, '') else 0
+    except (TypeError, ValueError):
+        raise ValueError("'quantity' must be an integer.")
+    if quantity < 0:
+        raise ValueError("'quantity' can't be negative.")
+    return title, author, stream, publication_date, quantity
+
+
+class BookImporter:
+    def __init__(self, user=None, on_conflict='update', chunk_size=None, max_errors=None):
+        if on_conflict not in ('update', 'skip'):
+            raise ImportFormatError("on_conflict must be 'update' or 'skip'.")
+        self.user = user
+        self.on_conflict = on_conflict
+        self.chunk_size = chunk_size or getattr(settings, 'LIBRARY_IMPORT_CHUNK_SIZE', 1000)
+        self.max_errors = max_errors or getattr(settings, 'LIBRARY_IMPORT_MAX_ERRORS', 1000)
+        self.report = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        self.touched_streams = set()
+
+    def error(self, row, message):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'row': row, 'error': message})
+        else:
+            self.report['errors_truncated'] = True
+
+    def run(self, records):
+        """Import `records` a chunk at a time. A file that turns out malformed part way raises
+        ImportFormatError; the chunks before it stay imported and are counted in `self.report`."""
+        numbered = enumerate(records, start=1)
+        try:
+            while True:
+                chunk = list(islice(numbered, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+        finally:
+            if self.report['created'] or self.report['updated']:
+                # bulk writes skip the model signals, so invalidate by hand
+                catalog_cache.bump_books(*self.touched_streams)
+                transaction.on_commit(get_search_backend().invalidate)
+                transaction.on_commit(get_suggest_index().invalidate)
+        return self.report
+
+    def import_chunk(self, chunk):
+        rows = []
+        for n, record in chunk:
+            self.report['rows'] += 1
+            try:
+                rows.append((n,) + clean_record(record))
+            except ValueError as exc:
+                self.error(n, str(exc))
+        if not rows:
+            return
+
+        try:
+            counts, errors = self.write_chunk(rows)
+        except IntegrityError:
+            # a concurrent import created some of these books after we looked
+            # for them; look again in a fresh transaction
+            counts, errors = self.write_chunk(rows)
+        for n, message in errors:
+            self.error(n, message)
+        for name, n in counts.items():
+            self.report[name] += n
+
+    def write_chunk(self, rows):
+        """Create or update the books of one chunk in a transaction. Returns (counts, errors)."""
+        counts, errors = {'created': 0, 'updated': 0, 'skipped': 0}, []
+        with transaction.atomic():
+            authors = self.resolve_authors({r[2] for r in rows})
+            streams = self.resolve_streams({r[3] for r in rows if r[3]})
+
+            # last occurrence of a key within the chunk wins
+            by_key = {}
+            for n, title, author, stream, publication_date, quantity in rows:
+                key = (title, authors[author], streams.get(stream))
+                if key in by_key:
+                    errors.append((by_key[key][0], f"Duplicate of row {n}."))
+                by_key[key] = (n, publication_date, quantity)
+
+            existing = self.existing_books(by_key)
+            now = timezone.now()
+            to_create, to_update, restocked = [], [], []
+            for key, (n, publication_date, quantity) in by_key.items():
+                title, author_id, stream_id = key
+                self.touched_streams.add(stream_id)
+                book = existing.get(key)
+                if book is None:
+                    to_create.append(Book(
+                        title=title, author_id=author_id, stream_id=stream_id,
+                        publication_date=publication_date, quantity=quantity,
+                        created_by=self.user, updated_by=self.user,
+                    ))
+                elif self.on_conflict == 'update':
+                    if quantity > book.quantity:
+                        restocked.append(book.pk)
+                    book.publication_date = publication_date
+                    book.quantity = quantity
+                    book.updated_by = self.user
+                    book.updated_at = now
+                    to_update.append(book)
+                else:
+                    counts['skipped'] += 1
+
+            Book.objects.bulk_create(to_create)
+            Book.objects.bulk_update(to_update, ['publication_date', 'quantity', 'updated_by', 'updated_at'])
+            if restocked:
+                # bulk_update skips the post_save that serves the waitlist
+                loans.serve_waitlist(restocked, now)
+            counts['created'] += len(to_create)
+            counts['updated'] += len(to_update)
+        return counts, errors
+
+    def resolve_authors(self, names):
+        # Author.name isn't unique; reuse the oldest author with that name
+        found = {}
+        for pk, name in Author.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            found[name] = pk
+        missing = names - found.keys()
+        if missing:
+            Author.objects.bulk_create(Author(name=name) for name in missing)
+            # MySQL doesn't return ids from bulk_create, so read them back
+            for pk, name in Author.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+                found[name] = pk
+        return found
+
+    def resolve_streams(self, names):
+        found = dict(Stream.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - found.keys()
+        if missing:
+            Stream.objects.bulk_create((Stream(name=name) for name in missing), ignore_conflicts=True)
+            found.update(Stream.objects.filter(name__in=missing).values_list('name', 'id'))
+        return found
+
+    def existing_books(self, keys):
+        # NULL streams / creators never collide in the unique index, so match
+        # on the key explicitly rather than relying on the database to reject them
+        titles = {title for title, _, _ in keys}
+        qs = Book.objects.filter(title__in=titles, created_by=self.user)
+        if self.user is None:
+            qs = Book.objects.filter(title__in=titles, created_by__isnull=True)
+        existing = {}
+        for book in qs.only('id', 'title', 'author_id', 'stream_id', 'publication_date', 'quantity'):
+            key = (book.title, book.author_id, book.stream_id)
+            if key in keys:
+                existing[key] = book
+        return existing
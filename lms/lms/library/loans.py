@@ -0,0 +1,392 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import catalog_cache, stats
+from .models import Book, BookRequest, StudentProfile
+
+# ----------------------------
+# Loan state changes
+# ----------------------------
+# Stock is never read into Python and written back. Approving is two
+# conditional UPDATEs in one transaction:
+#   request:  SET is_approved = 1      WHERE id = %s AND is_approved = 0
+#   book:     SET quantity = quantity - 1  WHERE id = %s AND quantity > 0
+# A request can't be approved twice, and a copy can't be lent twice, however
+# many approvals race. The request goes first and the contended book row
+# last, so the book's row lock is held only from its UPDATE to the commit.
+# The circulation counters (library/stats.py) come after the book on every
+# path, single or bulk: requests, then books, then counters, so no two loan
+# changes take those locks in opposite orders.
+
+
+class LoanError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def loan_days():
+    return getattr(settings, "LIBRARY_LOAN_DAYS", 7)
+
+
+def approve(pk, user=None):
+    """Approve BookRequest `pk` and take one copy of its book. Raises BookRequest.DoesNotExist or LoanError.
+    Given the approving `user`, a request another librarian holds a claim on is refused."""
+    loan = BookRequest.objects.filter(pk=pk).values("book_id", "student_id", stream_id=F("book__stream_id")).get()
+    now = timezone.now()
+    pending = BookRequest.objects.filter(pk=pk, is_approved=False)
+    if user is not None:
+        pending = pending.filter(unclaimed(now) | Q(claimed_by=user))
+    with transaction.atomic():
+        updated = pending.update(
+            is_approved=True, waitlisted=False, claimed_by=None, claim_expires_at=None,
+            approved_at=now, return_due_date=now + timedelta(days=loan_days()),
+        )
+        if not updated:
+            if user is not None and BookRequest.objects.filter(pk=pk, is_approved=False).exists():
+                raise LoanError("Another librarian has claimed this request.", status=409)
+            raise LoanError("Already approved.")
+        taken = Book.objects.filter(pk=loan["book_id"], quantity__gt=0).update(
+            quantity=F("quantity") - 1, updated_at=now)
+        if not taken:
+            raise LoanError("Book not available.")  # rolls the request back too
+        stats.add([loan], pending=-1, borrowed=1)
+        stats.add_daily(approved=1)
+        catalog_cache.bump_books(loan["stream_id"])
+
+
+# ----------------------------
+# Bulk approve / return
+# ----------------------------
+# One transaction for the whole batch. The requests are locked, then their
+# books, both in id order so two overlapping batches can't deadlock. Stock
+# is allocated in Python against the locked quantities, oldest request
+# first. The changes are then written with set-based UPDATEs: one for the
+# requests, and one per distinct quantity delta for the books (usually one
+# or two), not one per request.
+
+def bulk_max():
+    return getattr(settings, "LIBRARY_BULK_LOAN_MAX", 5000)
+
+
+def clean_ids(ids):
+    if not isinstance(ids, list) or not ids:
+        raise LoanError("Pass a non-empty list of request ids as 'ids'.")
+    if len(ids) > bulk_max():
+        raise LoanError(f"At most {bulk_max()} ids per call.", status=413)
+    try:
+        return list(dict.fromkeys(int(pk) for pk in ids))
+    except (TypeError, ValueError):
+        raise LoanError("Request ids must be integers.")
+
+
+def _lock(ids):
+    requests = {
+        row["id"]: row
+        for row in BookRequest.objects.select_for_update().filter(pk__in=ids).order_by("id")
+        .values("id", "student_id", "book_id", "is_approved", "is_returned", "requested_at", "overdue_flagged_at",
+                "claimed_by_id", "claim_expires_at")
+    }
+    book_ids = {row["book_id"] for row in requests.values()}
+    books = {
+        row["id"]: row
+        for row in Book.objects.select_for_update().filter(pk__in=book_ids).order_by("id")
+        .values("id", "quantity", "stream_id")
+    }
+    for row in requests.values():
+        row["stream_id"] = books[row["book_id"]]["stream_id"]
+    return requests, books
+
+
+def add_deltas(model, field, deltas, **extra):
+    """Add {pk: delta} to `field`, one UPDATE per distinct delta."""
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta}, **extra)
+    return bool(by_delta)
+
+
+def _apply_stock(deltas, books, now):
+    if add_deltas(Book, "quantity", deltas, updated_at=now):
+        catalog_cache.bump_books(*{books[book_id]["stream_id"] for book_id in deltas if deltas[book_id]})
+
+
+def restock(freed, books, now):
+    """Put returned copies ({book_id: n}) back: the book's waitlist first, the shelf after.
+    `books` maps each book_id to a row with its stream_id. Call inside a transaction."""
+    freed, handed_over = dict(freed), []
+    for book_id, copies in freed.items():
+        if copies > 0:
+            allocated = allocate_waitlist(book_id, books[book_id]["stream_id"], copies, now)
+            freed[book_id] -= len(allocated)
+            handed_over += allocated
+    _apply_stock(freed, books, now)
+    return handed_over
+
+
+def _results(ids, outcome):
+    return [
+        {"id": pk, "success": message is None, "message": message or "OK"}
+        for pk, message in ((pk, outcome[pk]) for pk in ids)
+    ]
+
+
+def _claimed_by_other(row, user, now):
+    # not `unclaimed(now) | Q(claimed_by=user)`, checked on a locked row
+    expires = row["claim_expires_at"]
+    return expires is not None and expires > now and row["claimed_by_id"] != user.pk
+
+
+def bulk_approve(ids, user=None):
+    """Approve the requests `ids`, oldest first while copies last. Given the approving
+    `user`, requests another librarian holds a claim on are refused, as in approve()."""
+    ids = clean_ids(ids)
+    now = timezone.now()
+    outcome = {}
+    with transaction.atomic():
+        requests, books = _lock(ids)
+        stock = {book_id: row["quantity"] for book_id, row in books.items()}
+        deltas = dict.fromkeys(stock, 0)
+        approved = []
+        for pk in ids:
+            if pk not in requests:
+                outcome[pk] = "Request not found."
+            elif requests[pk]["is_approved"]:
+                outcome[pk] = "Already approved."
+            elif user is not None and _claimed_by_other(requests[pk], user, now):
+                outcome[pk] = "Another librarian has claimed this request."
+        # first come, first served for the remaining copies
+        pending = sorted((r for pk, r in requests.items() if pk not in outcome),
+                         key=lambda r: (r["requested_at"], r["id"]))
+        for row in pending:
+            book_id = row["book_id"]
+            if stock[book_id] > 0:
+                stock[book_id] -= 1
+                deltas[book_id] -= 1
+                approved.append(row)
+                outcome[row["id"]] = None
+            else:
+                outcome[row["id"]] = "Book not available."
+
+        if approved:
+            BookRequest.objects.filter(pk__in=[row["id"] for row in approved]).update(
+                is_approved=True, waitlisted=False, claimed_by=None, claim_expires_at=None,
+                approved_at=now, return_due_date=now + timedelta(days=loan_days()),
+            )
+            _apply_stock(deltas, books, now)
+            stats.add(approved, pending=-1, borrowed=1)
+            stats.add_daily(approved=len(approved))
+    return _results(ids, outcome)
+
+
+def bulk_return(ids):
+    ids = clean_ids(ids)
+    now = timezone.now()
+    outcome = {}
+    with transaction.atomic():
+        requests, books = _lock(ids)
+        deltas = dict.fromkeys(books, 0)
+        flagged = []
+        returned = []
+        for pk in ids:
+            row = requests.get(pk)
+            if row is None:
+                outcome[pk] = "Book request not found."
+            elif not row["is_approved"]:
+                outcome[pk] = "This book is not approved yet."
+            elif row["is_returned"]:
+                outcome[pk] = "Book already returned."
+            else:
+                deltas[row["book_id"]] += 1
+                returned.append(row)
+                outcome[pk] = None
+                if row["overdue_flagged_at"]:
+                    flagged.append(row)
+
+        if returned:
+            BookRequest.objects.filter(pk__in=[row["id"] for row in returned]).update(
+                is_returned=True, returned_at=now,
+                was_overdue=Case(When(return_due_date__lt=now, then=Value(True)), default=Value(False)),
+            )
+            restock(deltas, books, now)
+            stats.add(returned, borrowed=-1, returned=1)
+            stats.add_daily(returned=len(returned))
+            unflag(flagged)
+    return _results(ids, outcome)
+
+
+# ----------------------------
+# Overdue loans
+# ----------------------------
+# A loan is overdue while it is approved, not returned and past its due
+# date; `overdue()` puts that in SQL, served by bookrequest_overdue_idx.
+# `sweep_overdue` flags newly overdue loans in batches and adds them to
+# StudentProfile.overdue_count and Book.overdue_count. Returning a flagged
+# loan takes it off again, so the counters always hold the open overdue
+# loans as of the last sweep. `recount_overdue` rebuilds them from scratch.
+
+def overdue(now=None):
+    return Q(is_approved=True, is_returned=False, return_due_date__lt=now or timezone.now())
+
+
+def sweep_batch_size():
+    return getattr(settings, "LIBRARY_OVERDUE_SWEEP_BATCH", 1000)
+
+
+def _count(rows, key):
+    counts = {}
+    for row in rows:
+        counts[row[key]] = counts.get(row[key], 0) + 1
+    return counts
+
+
+def unflag(rows):
+    """Take returned loans (rows with student_id, book_id and stream_id) off the overdue counters."""
+    add_deltas(StudentProfile, "overdue_count", {k: -n for k, n in _count(rows, "student_id").items()})
+    add_deltas(Book, "overdue_count", {k: -n for k, n in _count(rows, "book_id").items()})
+    stats.add(rows, overdue=-1)
+
+
+def sweep_overdue(batch_size=None):
+    """Flag every overdue loan not flagged yet. Returns the number flagged."""
+    batch_size = batch_size or sweep_batch_size()
+    now = timezone.now()
+    flagged = 0
+    while True:
+        with transaction.atomic():
+            due = overdue(now) & Q(overdue_flagged_at__isnull=True)
+            ids = list(
+                BookRequest.objects.filter(due).order_by("return_due_date", "id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return flagged
+            # lock just the request rows (not the joined books), in id order
+            # like _lock, then re-check them
+            rows = list(
+                BookRequest.objects.select_for_update(of=("self",))
+                .filter(due, pk__in=ids).order_by("id")
+                .values("id", "student_id", "book_id", stream_id=F("book__stream_id"))
+            )
+            BookRequest.objects.filter(pk__in=[row["id"] for row in rows]).update(overdue_flagged_at=now)
+            add_deltas(StudentProfile, "overdue_count", _count(rows, "student_id"))
+            add_deltas(Book, "overdue_count", _count(rows, "book_id"))
+            stats.add(rows, overdue=1)
+        flagged += len(rows)
+
+
+def recount_overdue():
+    open_flags = BookRequest.objects.filter(is_returned=False, overdue_flagged_at__isnull=False)
+    for model, key in ((StudentProfile, "student"), (Book, "book")):
+        counts = open_flags.filter(**{key: OuterRef("pk")}).order_by().values(key).annotate(n=Count("id")).values("n")
+        model.objects.update(overdue_count=Coalesce(Subquery(counts), 0))
+
+
+# ----------------------------
+# Waitlist
+# ----------------------------
+# A request for a book that is out of stock is created `waitlisted`. When a
+# copy comes back, the returning transaction approves the oldest waiting
+# request of an approved student instead of putting the copy back on the
+# shelf. Copies go down the book's pending requests strictly in
+# (requested_at, id) order, though: one that reaches an ordinary request,
+# made while copies were still on the shelf, goes back on the shelf for a
+# librarian to approve it, so that request is neither overtaken by a later
+# waitlisted one nor approved without a librarian. Stock raised by an edit
+# or an import is handed out the same way (`serve_waitlist`). The queue is
+# read through bookrequest_book_state_idx with SKIP LOCKED: concurrent
+# returns of the same book each lock and take different requests, and no
+# return waits on another's locks.
+
+def allocate_waitlist(book_id, stream_id, copies, now):
+    """Approve the waiting requests among the next `copies` pending requests for `book_id`,
+    oldest first. Returns their ids."""
+    eligible = StudentProfile.objects.filter(is_approved=True, user__is_active=True).values("id")
+    queue = list(
+        BookRequest.objects.select_for_update(skip_locked=True)
+        .filter(book_id=book_id, is_approved=False, is_returned=False, student_id__in=eligible)
+        .order_by("requested_at", "id")
+        .values("id", "student_id", "book_id", "waitlisted")[:copies]
+    )
+    rows = [row for row in queue if row.pop("waitlisted")]
+    ids = [row["id"] for row in rows]
+    if ids:
+        BookRequest.objects.filter(pk__in=ids).update(
+            is_approved=True, waitlisted=False, approved_at=now, return_due_date=now + timedelta(days=loan_days())
+        )
+        stats.add([dict(row, stream_id=stream_id) for row in rows], pending=-1, borrowed=1)
+        stats.add_daily(approved=len(ids))
+    return ids
+
+
+def serve_waitlist(book_ids, now=None):
+    """Hand the shelf copies of `book_ids` to their waitlists, after their stock was raised other
+    than by a return. Returns {book_id: copies handed out}. Call inside a transaction."""
+    now = now or timezone.now()
+    waiting = BookRequest.objects.filter(book_id=OuterRef("pk"), waitlisted=True)
+    books = {
+        row["id"]: row
+        for row in Book.objects.select_for_update().filter(Exists(waiting), pk__in=book_ids, quantity__gt=0)
+        .order_by("id").values("id", "quantity", "stream_id")
+    }
+    handed_out = {
+        book_id: len(allocate_waitlist(book_id, row["stream_id"], row["quantity"], now))
+        for book_id, row in books.items()
+    }
+    _apply_stock({book_id: -n for book_id, n in handed_out.items()}, books, now)
+    return handed_out
+
+
+# ----------------------------
+# Librarian work queue
+# ----------------------------
+# Instead of all working down the same list, each librarian claims the next
+# pending requests (oldest first, waitlisted ones excluded since they have no
+# copy to give). A claim is a lease: other librarians' claims skip those
+# requests, and approve() and bulk_approve() refuse them, until the lease
+# runs out. An expired claim needs no clean-up; it simply counts as
+# unclaimed again. Claiming reads bookrequest_pending_idx with SKIP LOCKED,
+# so librarians claiming at the same moment get disjoint requests without
+# waiting on each other.
+
+def claim_lease():
+    return timedelta(seconds=getattr(settings, "LIBRARY_CLAIM_LEASE_SECONDS", 300))
+
+
+def claim_max():
+    return getattr(settings, "LIBRARY_CLAIM_MAX", 50)
+
+
+def unclaimed(now):
+    return Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=now)
+
+
+def claim(user, limit):
+    """Claim up to `limit` pending requests for `user`, renewing claims they already hold.
+    Returns (ids, lease expiry)."""
+    now = timezone.now()
+    expires = now + claim_lease()
+    with transaction.atomic():
+        ids = list(
+            BookRequest.objects.select_for_update(skip_locked=True)
+            .filter(unclaimed(now) | Q(claimed_by=user), is_approved=False, waitlisted=False)
+            .order_by("requested_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        BookRequest.objects.filter(pk__in=ids).update(claimed_by=user, claim_expires_at=expires)
+    return ids, expires
+
+
+def release(user, ids=None):
+    """Give back `user`'s claims on `ids`, or all of them. Returns how many were released."""
+    claims = BookRequest.objects.filter(claimed_by=user, is_approved=False)
+    if ids is not None:
+        claims = claims.filter(pk__in=ids)
+    return claims.update(claimed_by=None, claim_expires_at=None)
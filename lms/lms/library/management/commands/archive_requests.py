@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from library import archive
+
+
+class Command(BaseCommand):
+    help = ("Move returned book requests older than --days into the archive table, in batches. "
+            "Meant to run on a schedule, e.g. nightly from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Defaults to LIBRARY_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Defaults to LIBRARY_ARCHIVE_BATCH.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options["days"]) if options["days"] is not None else None
+        if options["dry_run"]:
+            self.stdout.write(f"{archive.archivable(older_than).count()} returned request(s) would be archived.")
+            return
+        moved = archive.archive_returned(older_than, options["batch_size"])
+        self.stdout.write(f"Archived {moved} returned request(s).")
@@ -0,0 +1,65 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library import loans
+from library.models import Author, Book, BookRequest, CustomUser, StudentProfile
+
+
+class Command(BaseCommand):
+    help = ("Time approving and returning N requests one call at a time against one bulk call. "
+            "Seeded rows are rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--books", type=int, default=40)
+
+    def handle(self, *args, **options):
+        # a one-id bulk_return does what ReturnBookAPIView does per request
+        for label, approve, give_back in (
+            ("single", self.one_by_one(loans.approve), self.one_by_one(lambda pk: loans.bulk_return([pk]))),
+            ("bulk", loans.bulk_approve, loans.bulk_return),
+        ):
+            with transaction.atomic():
+                ids = self.seed(options["requests"], options["books"])
+                start = time.perf_counter()
+                approve(ids)
+                approved = time.perf_counter() - start
+                start = time.perf_counter()
+                give_back(ids)
+                returned = time.perf_counter() - start
+                self.stdout.write(
+                    f"{label:>6}: {len(ids)} requests  approve {approved * 1000:.0f}ms  return {returned * 1000:.0f}ms"
+                )
+                transaction.set_rollback(True)
+
+    def seed(self, count, books):
+        tag = uuid.uuid4().hex[:8]
+        author = Author.objects.create(name=f"bench-{tag}")
+        # enough copies for most requests, so both paths do the same writes
+        Book.objects.bulk_create(
+            Book(title=f"bench-{tag}-{i}", author=author, publication_date="2020-01-01", quantity=count // books)
+            for i in range(books)
+        )
+        book_ids = list(Book.objects.filter(author=author).values_list("pk", flat=True))
+        CustomUser.objects.bulk_create(CustomUser(username=f"bench-{tag}-{i}", is_student=True) for i in range(count))
+        users = CustomUser.objects.filter(username__startswith=f"bench-{tag}-")
+        StudentProfile.objects.bulk_create(StudentProfile(id=f"b{tag}{i}", user=user) for i, user in enumerate(users))
+        BookRequest.objects.bulk_create(
+            (BookRequest(student_id=f"b{tag}{i}", book_id=book_ids[i % len(book_ids)]) for i in range(count)),
+            batch_size=1000,
+        )
+        return list(BookRequest.objects.filter(book_id__in=book_ids).values_list("pk", flat=True))
+
+    @staticmethod
+    def one_by_one(call):
+        def run(ids):
+            for pk in ids:
+                try:
+                    call(pk)
+                except loans.LoanError:
+                    pass
+        return run
+
@@ -0,0 +1,73 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library import content_search
+from library.management.commands.bench_search import WORDS, make_word
+from library.models import Author, Book, BookPage, Stream
+
+
+class Command(BaseCommand):
+    help = "Seed books with synthetic PDF page text (rolled back afterwards) and report content search latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,300", help="Comma-separated numbers of books to measure.")
+        parser.add_argument("--pages", type=int, default=100, help="Pages per book.")
+        parser.add_argument("--words", type=int, default=150, help="Words per page.")
+        parser.add_argument("--runs", type=int, default=100, help="Queries per size.")
+        parser.add_argument("--legacy", action="store_true",
+                            help="Also time an icontains scan over the page text for comparison.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options["sizes"].split(","))
+        rng = random.Random(11)
+        # Zipf-like vocabulary: a few very common words, a long tail of rare ones
+        vocabulary = WORDS + list({make_word(rng) for _ in range(20000)})
+        rng.shuffle(vocabulary)
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        with transaction.atomic():
+            stream = Stream.objects.create(name=f"bench-{rng.random()}")
+            author = Author.objects.create(name="Bench Author")
+            seeded = 0
+            for size in sizes:
+                start = time.perf_counter()
+                while seeded < size:
+                    book = Book.objects.create(
+                        title=f"Bench {seeded}", author=author, stream=stream, publication_date="2020-01-01",
+                        page_count=options["pages"], pdf_status=Book.PDF_READY,
+                    )
+                    pages = [
+                        (n, " ".join(rng.choices(vocabulary, cum_weights=weights, k=options["words"])))
+                        for n in range(1, options["pages"] + 1)
+                    ]
+                    BookPage.objects.bulk_create((BookPage(book=book, number=n, text=t) for n, t in pages), batch_size=500)
+                    content_search.index_book(book.pk, pages)
+                    seeded += 1
+                self.stdout.write(f"seeded {size} books x {options['pages']} pages in {time.perf_counter() - start:.1f}s")
+
+                # one mid-frequency word and one rare one, as a student would type
+                queries = [f"{rng.choice(vocabulary[50:500])} {rng.choice(vocabulary[500:])}" for _ in range(50)]
+                self.report(size, "index", queries, options["runs"], content_search.search)
+                if options["legacy"]:
+                    self.report(size, "icontains", queries, min(options["runs"], 10), lambda q: list(
+                        BookPage.objects.filter(text__icontains=q.split()[0]).values_list("book_id", flat=True).distinct()
+                    ))
+
+            transaction.set_rollback(True)
+
+    def report(self, size, label, queries, runs, run):
+        timings = []
+        for i in range(runs):
+            start = time.perf_counter()
+            run(queries[i % len(queries)])
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"{label:>10} books={size:<8} p50={statistics.median(timings):.2f}ms p99={p99:.2f}ms"
+        )
@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from library.models import Author, Book, Stream
+from library.search import InProcessSearchBackend, get_search_backend
+
+WORDS = (
+    "advanced applied algebra analysis biology calculus chemistry circuits "
+    "computing data design digital discrete economics electronics engineering "
+    "finance fluid foundations genetics geometry history introduction language "
+    "learning linear logic machine management marketing mechanics methods "
+    "microbiology modern networks numerical operating organic physics principles "
+    "probability programming quantum signals statistics structures systems theory "
+    "thermodynamics topology"
+).split()
+
+SYLLABLES = "ka lo mi ra tu ve zon pri ste gal mor dex qui lan bor fen".split()
+
+
+def make_word(rng):
+    # synthetic vocabulary so term selectivity looks like a real catalog
+    return "".join(rng.choice(SYLLABLES) for _ in range(3))
+
+
+class Command(BaseCommand):
+    help = "Seed growing catalogs (rolled back afterwards) and report search latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated catalog sizes to measure.")
+        parser.add_argument("--runs", type=int, default=200, help="Queries per catalog size.")
+        parser.add_argument("--legacy", action="store_true",
+                            help="Also time the old icontains filter for comparison.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options["sizes"].split(","))
+        rng = random.Random(42)
+        backend = get_search_backend()
+
+        with transaction.atomic():
+            stream = Stream.objects.create(name=f"bench-{rng.random()}")
+            authors = Author.objects.bulk_create(
+                Author(name=f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}")
+                for _ in range(500)
+            )
+            seeded = 0
+            for size in sizes:
+                batch = []
+                while seeded < size:
+                    title = " ".join(rng.sample(WORDS, 2) + [make_word(rng), make_word(rng)])
+                    batch.append(Book(title=title, author=rng.choice(authors), stream=stream,
+                                      publication_date="2020-01-01", quantity=1))
+                    seeded += 1
+                Book.objects.bulk_create(batch, batch_size=5000)
+                if isinstance(backend, InProcessSearchBackend):
+                    backend.rebuild()  # bulk_create skips the indexing signals
+
+                queries = [f"{rng.choice(WORDS)} {make_word(rng)[:4]}" for _ in range(50)]
+                self.report(size, "index", queries, options["runs"],
+                            lambda q: backend.search(Book.objects.all(), q))
+                if options["legacy"]:
+                    self.report(size, "icontains", queries, options["runs"], lambda q: Book.objects.filter(
+                        Q(title__icontains=q) | Q(author__name__icontains=q)))
+
+            transaction.set_rollback(True)
+
+        if isinstance(backend, InProcessSearchBackend):
+            backend.rebuild()
+
+    def report(self, size, label, queries, runs, run):
+        timings = []
+        for i in range(runs):
+            query = queries[i % len(queries)]
+            start = time.perf_counter()
+            list(run(query).values_list("id", "title"))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"{label:>10} books={size:<8} p50={statistics.median(timings):.2f}ms p99={p99:.2f}ms"
+        )
@@ -0,0 +1,83 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from library.models import Author, Book, BookRequest, CustomUser, Stream, StudentProfile
+from library.serializers import (
+    BookRequestSerializer,
+    BookRequestValuesListSerializer,
+    BookSerializer,
+    BookValuesListSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare rows/sec of the ModelSerializer and values() list paths (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated row counts to measure.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options["sizes"].split(","))
+        with transaction.atomic():
+            stream = Stream.objects.create(name="bench-serializers")
+            authors = Author.objects.bulk_create(Author(name=f"Author {i}") for i in range(100))
+            students = []
+            for i in range(50):
+                user = CustomUser.objects.create(username=f"bench-serializers-{i}", is_student=True)
+                students.append(StudentProfile.objects.create(id=f"bench{i}", user=user))
+
+            seeded = 0
+            for size in sizes:
+                now = timezone.now()
+                books = Book.objects.bulk_create(
+                    (Book(title=f"Bench title {n}", author=authors[n % len(authors)], stream=stream,
+                          publication_date="2020-01-01", quantity=3, pdf=f"books/pdfs/bench{n}.pdf")
+                     for n in range(seeded, size)),
+                    batch_size=5000,
+                )
+                BookRequest.objects.bulk_create(
+                    (BookRequest(student=students[n % len(students)], book=book, is_approved=n % 2 == 0,
+                                 approved_at=now, return_due_date=now)
+                     for n, book in enumerate(books, start=seeded)),
+                    batch_size=5000,
+                )
+                seeded = size
+
+                book_qs = Book.objects.filter(stream=stream)
+                request_qs = BookRequest.objects.filter(book__stream=stream)
+                self.compare(size, "books",
+                             lambda: BookSerializer(book_qs.select_related("author", "stream"), many=True).data,
+                             lambda: BookValuesListSerializer(book_qs).data)
+                self.compare(size, "requests",
+                             lambda: BookRequestSerializer(request_qs.select_related("student", "book"), many=True).data,
+                             lambda: BookRequestValuesListSerializer(request_qs).data)
+
+            transaction.set_rollback(True)
+
+    def compare(self, size, label, slow, fast):
+        results = []
+        # pdf_url signatures embed the current second; pin it so both outputs match
+        with mock.patch("django.core.signing.time.time", return_value=time.time()):
+            for run in (slow, fast):
+                results.append(self.measure(run))
+        (slow_data, slow_rate), (fast_data, fast_rate) = results
+        if [dict(row) for row in slow_data] != fast_data:
+            raise CommandError(f"{label}: values() output differs from the ModelSerializer output")
+        self.stdout.write(
+            f"{label:>8} rows={size:<8} serializer={slow_rate:>10.0f} rows/s  "
+            f"values={fast_rate:>10.0f} rows/s  x{fast_rate / slow_rate:.1f}"
+        )
+
+    def measure(self, run):
+        best = None
+        for _ in range(2):  # best of two, so the first size isn't charged for warm-up
+            start = time.perf_counter()
+            data = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return data, len(data) / best
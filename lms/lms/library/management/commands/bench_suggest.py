@@ -0,0 +1,65 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.management.commands.bench_search import WORDS, make_word
+from library.models import Author, Book, Stream
+from library.suggest import get_suggest_index
+
+
+class Command(BaseCommand):
+    help = "Seed growing catalogs (rolled back afterwards) and report typeahead lookup times."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated catalog sizes to measure.")
+        parser.add_argument("--prefixes", type=int, default=500, help="Distinct prefixes looked up per size.")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options["sizes"].split(","))
+        rng = random.Random(7)
+        index = get_suggest_index()
+
+        with transaction.atomic():
+            stream = Stream.objects.create(name=f"bench-{rng.random()}")
+            authors = Author.objects.bulk_create(
+                Author(name=f"{make_word(rng).title()} {make_word(rng).title()}") for _ in range(500)
+            )
+            seeded = 0
+            for size in sizes:
+                batch = []
+                while seeded < size:
+                    title = " ".join(rng.sample(WORDS, 2) + [make_word(rng), make_word(rng)])
+                    batch.append(Book(title=title, author=rng.choice(authors), stream=stream,
+                                      publication_date="2020-01-01", quantity=1))
+                    seeded += 1
+                Book.objects.bulk_create(batch, batch_size=5000)
+
+                start = time.perf_counter()
+                index.rebuild()  # bulk_create skips the indexing signals
+                build = time.perf_counter() - start
+
+                prefixes = []
+                for _ in range(options["prefixes"]):
+                    word = rng.choice(WORDS + [make_word(rng)])
+                    prefixes.append(word[:rng.randint(1, len(word))])
+                # first pass ranks each prefix from the sorted keys, second hits the memo
+                for label in ("cold", "warm"):
+                    timings = []
+                    for prefix in prefixes:
+                        start = time.perf_counter()
+                        index.suggest(prefix)
+                        timings.append((time.perf_counter() - start) * 1_000_000)
+                    timings.sort()
+                    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+                    self.stdout.write(
+                        f"books={size:<8} build={build:.2f}s {label} "
+                        f"p50={statistics.median(timings):.0f}us p99={p99:.0f}us"
+                    )
+
+            transaction.set_rollback(True)
+
+        index.invalidate()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from library import recommendations
+
+
+class Command(BaseCommand):
+    help = ("Count the books borrowed by the same students since the last run and refresh the similar books "
+            "behind /api/books/<pk>/similar/. Meant to run on a schedule, e.g. nightly from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Defaults to LIBRARY_RECOMMENDATION_BATCH.")
+        parser.add_argument("--rebuild", action="store_true", help="Drop the counts and recount every loan.")
+
+    def handle(self, *args, **options):
+        loans, books = recommendations.build(options["batch_size"], rebuild=options["rebuild"])
+        self.stdout.write(f"Counted {loans} loan(s); rescored {books} book(s).")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from library.uploads import abort_upload, stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete PDF upload sessions (and their part files) untouched for longer than --hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=None,
+                            help="Defaults to LIBRARY_UPLOAD_EXPIRY_HOURS.")
+
+    def handle(self, *args, **options):
+        removed = 0
+        for upload in stale_uploads(options["hours"]).iterator():
+            abort_upload(upload)
+            removed += 1
+        self.stdout.write(f"Removed {removed} stale upload(s).")
@@ -0,0 +1,113 @@
+import os
+import time
+from collections import defaultdict
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from library.exports import iter_batches
+from library.models import Book, PDFBlob
+from library.storage import content_digest, hashed_name, is_hashed, pdf_storage
+
+
+class Command(BaseCommand):
+    help = ("Move existing Book PDFs to content-addressed names, merging identical files, "
+            "and rebuild the PDF and thumbnail reference counts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without touching anything.")
+        parser.add_argument("--delete-orphans", action="store_true",
+                            help="Also delete files under books/pdfs/ and books/thumbs/ that no book references.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        stats = {"moved": 0, "merged": 0, "missing": 0, "bytes_saved": 0}
+
+        # one pass over the books in id batches; every book sharing a file is
+        # repointed together, so later batches already see the hashed name.
+        # Rows of the same batch still show the old name: `done` maps it to
+        # its hashed name for the rest of the run, and `targets` holds the
+        # hashed names this run created (or, dry, would have)
+        done, targets = {}, set()
+        rows = iter_batches(Book.objects.exclude(pdf="").exclude(pdf__isnull=True).values("id", "pdf"))
+        for row in rows:
+            name = row["pdf"]
+            if is_hashed(name):
+                continue
+            if name in done:
+                stats["merged"] += 1  # shared the file already, repointed with the first of them
+                continue
+            if not pdf_storage.exists(name):
+                stats["missing"] += 1
+                self.stderr.write(f"Book {row['id']}: {name} is missing")
+                continue
+
+            with pdf_storage.open(name, "rb") as f:
+                target = hashed_name(name, content_digest(File(f)))
+            if target in targets or pdf_storage.exists(target):
+                stats["merged"] += 1
+                stats["bytes_saved"] += pdf_storage.size(name)
+            else:
+                stats["moved"] += 1
+            done[name] = target
+            targets.add(target)
+            if dry_run:
+                continue
+
+            # link first, repoint the rows, then drop the old name: a crash at
+            # any step leaves every book pointing at a file that exists
+            source, destination = pdf_storage.path(name), pdf_storage.path(target)
+            if not os.path.exists(destination):
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.link(source, destination)
+            Book.objects.filter(pdf=name).update(pdf=target)
+            os.remove(source)
+
+        if not dry_run:
+            self.rebuild_counts()
+        if options["delete_orphans"]:
+            stats["orphans_deleted"] = self.delete_orphans(dry_run)
+
+        prefix = "Would have: " if dry_run else ""
+        self.stdout.write(prefix + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+    def rebuild_counts(self):
+        with transaction.atomic():
+            # lock every blob first: drop_reference and collect wait for the
+            # new counts instead of finding a row missing and deleting its file
+            list(PDFBlob.objects.select_for_update().order_by("name").values_list("id", flat=True))
+            by_count = defaultdict(list)
+            for field in ("pdf", "thumbnail"):
+                counts = (
+                    Book.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+                    .values_list(field).annotate(n=Count("id")).order_by()
+                )
+                for name, n in counts.iterator():
+                    by_count[n].append(name)
+            names = [name for group in by_count.values() for name in group]
+            PDFBlob.objects.bulk_create((PDFBlob(name=name) for name in names), ignore_conflicts=True, batch_size=1000)
+            PDFBlob.objects.update(ref_count=0)
+            for n, group in by_count.items():
+                for start in range(0, len(group), 1000):
+                    PDFBlob.objects.filter(name__in=group[start:start + 1000]).update(ref_count=n)
+            PDFBlob.objects.filter(ref_count=0).delete()
+
+    def delete_orphans(self, dry_run):
+        deleted = 0
+        for field in ("pdf", "thumbnail"):
+            file_field = Book._meta.get_field(field)
+            root = file_field.storage.path(file_field.upload_to)
+            for directory, _, files in os.walk(root):
+                for filename in files:
+                    path = os.path.join(directory, filename)
+                    if time.time() - os.path.getmtime(path) < 3600:
+                        continue  # maybe saved a moment ago and not yet committed to a book
+                    name = os.path.relpath(path, file_field.storage.location).replace(os.sep, "/")
+                    if Book.objects.filter(**{field: name}).exists():
+                        continue
+                    deleted += 1
+                    if not dry_run:
+                        os.remove(path)
+        return deleted
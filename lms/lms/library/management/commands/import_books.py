@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importers import BookImporter, ImportFormatError, guess_format, iter_records
+from library.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Import books from a CSV or NDJSON file (title, author, stream, publication_date, quantity)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension.")
+        parser.add_argument("--user", help="Username recorded as created_by / updated_by.")
+        parser.add_argument("--on-conflict", choices=["update", "skip"], default="update",
+                            help="What to do with rows matching an existing book.")
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = CustomUser.objects.get(username=options["user"])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' not found.")
+
+        fmt = options["format"] or guess_format(options["path"])
+        importer = BookImporter(user=user, on_conflict=options["on_conflict"], chunk_size=options["chunk_size"])
+        try:
+            with open(options["path"], "rb") as fh:
+                report = importer.run(iter_records(fh, fmt))
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        summary = {k: v for k, v in report.items() if k != "errors"}
+        self.stdout.write(json.dumps(summary))
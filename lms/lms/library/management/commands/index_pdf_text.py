@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library import content_search
+from library.models import Book, BookPage
+
+
+class Command(BaseCommand):
+    help = "Rebuild the PDF content search index from the extracted page text, one book at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--book", type=int, action="append", help="Only these book ids (repeatable).")
+
+    def handle(self, *args, **options):
+        books = Book.objects.filter(pdf_status=Book.PDF_READY)
+        if options["book"]:
+            books = books.filter(pk__in=options["book"])
+
+        indexed = terms = 0
+        for book_id in books.order_by("id").values_list("id", flat=True):
+            pages = BookPage.objects.filter(book_id=book_id).order_by("number").values_list("number", "text")
+            with transaction.atomic():
+                terms += content_search.index_book(book_id, pages.iterator(chunk_size=200))
+            indexed += 1
+        self.stdout.write(f"Indexed {indexed} book(s), {terms} term row(s).")
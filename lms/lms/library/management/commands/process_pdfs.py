@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from library.models import Book
+from library.pdf_processing import process_book
+
+
+class Command(BaseCommand):
+    help = "Extract page count, thumbnail and page text for books whose PDF hasn't been processed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", default="pending", help="Comma-separated statuses to (re)process, e.g. pending,failed.")
+        parser.add_argument("--all", action="store_true", help="Reprocess every book that has a PDF.")
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(pdf="").exclude(pdf__isnull=True)
+        if not options["all"]:
+            books = books.filter(pdf_status__in=options["status"].split(","))
+
+        done = failed = 0
+        for book_id in books.order_by("id").values_list("id", flat=True):
+            if process_book(book_id):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(f"Processed {done} PDF(s); {failed} failed or skipped.")
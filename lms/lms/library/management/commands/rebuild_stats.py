@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from library import stats
+
+
+class Command(BaseCommand):
+    help = ("Recompute the circulation counters behind /api/stats/ from the book requests and their archive, "
+            "e.g. after deploying them or after rows were changed outside the ORM.")
+
+    def handle(self, *args, **options):
+        rows, days = stats.rebuild()
+        self.stdout.write(f"Rebuilt {rows} counter row(s) and {days} day(s) of activity.")
@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from library import loans, stats
+from library.models import Author, Book, BookRequest, CirculationStat, CustomUser, StudentProfile
+
+
+def legacy_approve(pk):
+    # the read-modify-write approval this replaced, kept for comparison
+    req = BookRequest.objects.select_related("book").get(pk=pk)
+    if req.is_approved:
+        raise loans.LoanError("Already approved.")
+    if req.book.quantity < 1:
+        raise loans.LoanError("Book not available.")
+    req.is_approved = True
+    req.approved_at = timezone.now()
+    req.return_due_date = req.approved_at + timedelta(days=7)
+    req.save()
+    req.book.quantity -= 1
+    req.book.save()
+
+
+class Command(BaseCommand):
+    help = ("Approve many requests for one book from concurrent threads and check that no copy is lent "
+            "twice. Uses the configured database; the seeded rows are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--copies", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--legacy", action="store_true", help="Run the old read-modify-write approval instead.")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        author = Author.objects.create(name=f"stress-{tag}")
+        book = Book.objects.create(title=f"stress-{tag}", author=author, publication_date="2020-01-01",
+                                   quantity=options["copies"])
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f"stress-{tag}-{i}", is_student=True) for i in range(options["requests"])
+        )
+        # read back rather than trust bulk_create for ids (MySQL doesn't return them)
+        users = list(CustomUser.objects.filter(username__startswith=f"stress-{tag}-"))
+        StudentProfile.objects.bulk_create(
+            StudentProfile(id=f"s{tag}{i}", user=user) for i, user in enumerate(users)
+        )
+        BookRequest.objects.bulk_create(
+            BookRequest(student_id=f"s{tag}{i}", book=book) for i in range(len(users))
+        )
+
+        try:
+            self.run(book, options)
+        finally:
+            self.forget_stats(book, tag)
+            with stats.keeping_counts():  # forget_stats took them off already
+                book.delete()
+                author.delete()
+                CustomUser.objects.filter(username__startswith=f"stress-{tag}-").delete()
+
+    @staticmethod
+    def forget_stats(book, tag):
+        # the seeded requests never counted as pending (bulk_create), but their approvals were counted
+        approved = list(BookRequest.objects.filter(book=book, is_approved=True).values("book_id", "student_id", "book__stream_id"))
+        stats.add([dict(row, stream_id=row.pop("book__stream_id")) for row in approved], pending=1, borrowed=-1)
+        stats.add_daily(approved=-len(approved))
+        CirculationStat.objects.filter(
+            Q(scope=CirculationStat.BOOK, key=str(book.pk)) | Q(scope=CirculationStat.STUDENT, key__startswith=f"s{tag}"),
+        ).delete()
+
+    def run(self, book, options):
+        approve = legacy_approve if options["legacy"] else loans.approve
+        pending = queue.Queue()
+        for pk in BookRequest.objects.filter(book=book).values_list("pk", flat=True):
+            pending.put(pk)
+        counts = {"approved": 0, "denied": 0, "errors": 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        pk = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    for attempt in range(5):
+                        try:
+                            approve(pk)
+                            outcome = "approved"
+                        except loans.LoanError:
+                            outcome = "denied"
+                        except OperationalError:  # e.g. SQLite "database is locked"
+                            outcome = "errors"
+                            time.sleep(0.01 * (attempt + 1))
+                            continue
+                        break
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        book.refresh_from_db()
+        approved = BookRequest.objects.filter(book=book, is_approved=True).count()
+        copies = options["copies"]
+        oversold = max(approved - copies, 0)
+        lost_updates = approved - (copies - book.quantity)  # approvals whose decrement was overwritten
+        self.stdout.write(
+            f"{'legacy' if options['legacy'] else 'atomic'}: {options['requests']} requests for {copies} copies "
+            f"on {options['threads']} threads in {elapsed:.2f}s ({options['requests'] / elapsed:.0f} approvals/s tried)"
+        )
+        self.stdout.write(
+            f"  approved={approved} denied={counts['denied']} errors={counts['errors']} "
+            f"final quantity={book.quantity} oversold={oversold} lost stock updates={lost_updates}"
+        )
+        if oversold or lost_updates:
+            self.stdout.write(self.style.ERROR("  stock is inconsistent"))
+        else:
+            self.stdout.write(self.style.SUCCESS("  no oversells"))
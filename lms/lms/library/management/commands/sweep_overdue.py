@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from library import loans
+
+
+class Command(BaseCommand):
+    help = ("Flag loans that have become overdue and add them to the per-student and per-book overdue "
+            "counters. Meant to run on a schedule, e.g. hourly from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Loans per transaction. Defaults to LIBRARY_OVERDUE_SWEEP_BATCH.")
+        parser.add_argument("--recount", action="store_true",
+                            help="Rebuild the counters from the flagged loans first, e.g. after deleting requests.")
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            loans.recount_overdue()
+            self.stdout.write("Recounted overdue loans.")
+        flagged = loans.sweep_overdue(options["batch_size"])
+        self.stdout.write(f"Flagged {flagged} overdue loan(s).")
@@ -0,0 +1,29 @@
+# FULLTEXT indexes backing MySQLFullTextSearchBackend (library/search.py).
+# Other backends use the in-process index, so this is a no-op there.
+
+from django.db import migrations
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('CREATE FULLTEXT INDEX library_book_title_ft ON library_book (title)')
+    schema_editor.execute('CREATE FULLTEXT INDEX library_author_name_ft ON library_author (name)')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX library_book_title_ft ON library_book')
+    schema_editor.execute('DROP INDEX library_author_name_ft ON library_author')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_bookrequest_was_overdue'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+    ]
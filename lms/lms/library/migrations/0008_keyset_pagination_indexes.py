@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_fulltext_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['requested_at', 'id'], name='bookrequest_requested_id_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='stream',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
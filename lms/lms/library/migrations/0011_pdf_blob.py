@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:44
+
+import library.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_pdf_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PDFBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='pdf',
+            field=models.FileField(blank=True, null=True, storage=library.storage.get_pdf_storage, upload_to='books/pdfs/'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_pdf_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='books/thumbs/'),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='library.book')),
+            ],
+            options={
+                'unique_together': {('book', 'number')},
+            },
+        ),
+    ]
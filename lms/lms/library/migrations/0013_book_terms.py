@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_pdf_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('tf', models.PositiveIntegerField()),
+                ('pages', models.TextField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='library.book')),
+            ],
+            options={
+                'unique_together': {('term', 'book')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_book_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='overdue_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bookrequest',
+            name='overdue_flagged_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='overdue_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['is_approved', 'is_returned', 'return_due_date'], name='bookrequest_overdue_idx'),
+        ),
+    ]
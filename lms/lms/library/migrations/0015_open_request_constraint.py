@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:57
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def close_duplicate_requests(apps, schema_editor):
+    # racing submits could leave several open requests for one student and
+    # book; keep the approved or else the oldest one. Extra pending requests
+    # are dropped; extra approved loans are marked returned and their copies
+    # (and overdue flags) given back, so the constraint below can be added
+    BookRequest = apps.get_model('library', 'BookRequest')
+    Book = apps.get_model('library', 'Book')
+    StudentProfile = apps.get_model('library', 'StudentProfile')
+    now = timezone.now()
+    duplicates = (
+        BookRequest.objects.filter(is_returned=False).values('student_id', 'book_id')
+        .annotate(n=Count('id')).filter(n__gt=1).values_list('student_id', 'book_id')
+    )
+    for student_id, book_id in duplicates:
+        open_requests = BookRequest.objects.filter(is_returned=False, student_id=student_id, book_id=book_id).order_by('-is_approved', 'requested_at', 'id')
+        extra = open_requests.exclude(id=open_requests.values_list('id', flat=True)[0])
+        extra.filter(is_approved=False).delete()
+        loans = extra.filter(is_approved=True)
+        returned = loans.count()
+        if not returned:
+            continue
+        flagged = loans.filter(overdue_flagged_at__isnull=False).count()
+        loans.update(is_returned=True, returned_at=now)
+        Book.objects.filter(id=book_id).update(quantity=F('quantity') + returned, overdue_count=F('overdue_count') - flagged)
+        StudentProfile.objects.filter(id=student_id).update(overdue_count=F('overdue_count') - flagged)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_overdue_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookrequest',
+            name='open_book',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(is_returned=False, then=models.F('book_id')), default=None), output_field=models.BigIntegerField(null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['student', 'requested_at', 'id'], name='bookrequest_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['book', 'is_approved', 'is_returned', 'requested_at'], name='bookrequest_book_state_idx'),
+        ),
+        migrations.RunPython(close_duplicate_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookrequest',
+            constraint=models.UniqueConstraint(fields=('student', 'open_book'), name='bookrequest_one_open_per_book'),
+        ),
+    ]
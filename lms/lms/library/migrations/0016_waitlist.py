@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_open_request_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookrequest',
+            name='waitlisted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['book', 'waitlisted', 'requested_at', 'id'], name='bookrequest_waitlist_idx'),
+        ),
+    ]
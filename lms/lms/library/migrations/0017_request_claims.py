@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookrequest',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookrequest',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['is_approved', 'waitlisted', 'requested_at', 'id'], name='bookrequest_pending_idx'),
+        ),
+    ]
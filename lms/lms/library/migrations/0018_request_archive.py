@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_request_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRequestArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('is_approved', models.BooleanField(default=True)),
+                ('requested_at', models.DateTimeField()),
+                ('approved_at', models.DateTimeField(blank=True, null=True)),
+                ('return_due_date', models.DateTimeField(blank=True, null=True)),
+                ('is_returned', models.BooleanField(default=True)),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('was_overdue', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['returned_at'], name='bookrequest_returned_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookrequestarchive',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_requests', to='library.book'),
+        ),
+        migrations.AddField(
+            model_name='bookrequestarchive',
+            name='student',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_requests', to='library.studentprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequestarchive',
+            index=models.Index(fields=['student', 'requested_at', 'id'], name='bookrequestarchive_student_idx'),
+        ),
+    ]
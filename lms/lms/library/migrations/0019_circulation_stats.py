@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0018_request_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('book', 'Book'), ('stream', 'Stream'), ('student', 'Student')], max_length=10)),
+                ('key', models.CharField(max_length=20)),
+                ('pending', models.IntegerField(default=0)),
+                ('borrowed', models.IntegerField(default=0)),
+                ('returned', models.IntegerField(default=0)),
+                ('overdue', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='circulationstat_scope_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('requested', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('returned', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'shard'), name='dailycirculation_day_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0019_circulation_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoBorrowMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approved_at', models.DateTimeField(blank=True, null=True)),
+                ('request_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CoBorrowCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'other'), name='coborrowcount_pair')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_books', to='library.book')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='similarbook_book_rank')],
+            },
+        ),
+    ]
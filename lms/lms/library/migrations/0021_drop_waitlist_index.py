@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0020_recommendations'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookrequest',
+            name='bookrequest_waitlist_idx',
+        ),
+    ]
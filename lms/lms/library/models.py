@@ -1,9 +1,13 @@
 from django.utils import timezone
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, When
 from django.contrib.auth.models import AbstractUser
 import random
 import string
+import uuid
+
+from .storage import get_pdf_storage
 
 # -----------------------
 # Utility Function
@@ -34,6 +38,7 @@ class CustomUser(AbstractUser):
 
 class Stream(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -64,6 +69,8 @@ class StudentProfile(models.Model):
         related_name='students'
     )
     is_approved = models.BooleanField(default=False)
+    # loans flagged overdue and not yet returned, kept by library/loans.py
+    overdue_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.id
@@ -82,6 +89,7 @@ class StudentProfile(models.Model):
 class Author(models.Model):
     name = models.CharField(max_length=100)
     bio = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -99,7 +107,16 @@ class Book(models.Model):
     quantity = models.PositiveIntegerField(default=0)
 
      # ✅ New field for uploading the PDF
-    pdf = models.FileField(upload_to="books/pdfs/", null=True, blank=True)
+    pdf = models.FileField(upload_to="books/pdfs/", storage=get_pdf_storage, null=True, blank=True)
+
+    # derived from the PDF in the background (library/pdf_processing.py)
+    PDF_PENDING, PDF_READY, PDF_FAILED = 'pending', 'ready', 'failed'
+    PDF_STATUS_CHOICES = [(PDF_PENDING, 'Pending'), (PDF_READY, 'Ready'), (PDF_FAILED, 'Failed')]
+    pdf_status = models.CharField(max_length=10, choices=PDF_STATUS_CHOICES, blank=True, default='', editable=False)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail = models.FileField(upload_to="books/thumbs/", null=True, blank=True, editable=False)
+    # loans flagged overdue and not yet returned, kept by library/loans.py
+    overdue_count = models.PositiveIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
@@ -123,8 +140,18 @@ class Book(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # storing a PDF locks its PDFBlob row until the signals have counted
+        # the reference (library/storage.py); keep both in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         unique_together = ('title', 'author', 'stream', 'created_by')
+        indexes = [
+            # keyset pagination key for ?ordering=title
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
 
 
 
@@ -144,6 +171,50 @@ class BookRequest(models.Model):
 
 
     was_overdue = models.BooleanField(default=False)
+    # queued because the book was out of stock; a returned copy goes to the
+    # oldest waiting request instead of back on the shelf (library/loans.py)
+    waitlisted = models.BooleanField(default=False, editable=False)
+    # librarian working on this pending request, until claim_expires_at
+    # (POST /api/book-requests/claim/, library/loans.py)
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='claimed_requests'
+    )
+    claim_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # set by `manage.py sweep_overdue` when it counts the loan as overdue
+    overdue_flagged_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # book_id while the request is open (not returned), NULL after. Unique with
+    # student, this is a partial unique index that MySQL can also enforce:
+    # NULLs never collide, so returned requests don't count.
+    open_book = models.GeneratedField(
+        expression=Case(When(is_returned=False, then=F('book_id')), default=None),
+        output_field=models.BigIntegerField(null=True),
+        db_persist=True,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'open_book'], name='bookrequest_one_open_per_book'),
+        ]
+        indexes = [
+            # keyset pagination key for ?ordering=requested_at
+            models.Index(fields=['requested_at', 'id'], name='bookrequest_requested_id_idx'),
+            # open loans by due date: ?overdue= and the overdue sweep
+            models.Index(fields=['is_approved', 'is_returned', 'return_due_date'], name='bookrequest_overdue_idx'),
+            # a student's own list, in either keyset ordering
+            models.Index(fields=['student', 'requested_at', 'id'], name='bookrequest_student_idx'),
+            # a book's requests by state, oldest first (loans, approval queues,
+            # and the order returned copies are handed out)
+            models.Index(fields=['book', 'is_approved', 'is_returned', 'requested_at'], name='bookrequest_book_state_idx'),
+            # returned loans by age: what `archive_requests` moves out
+            models.Index(fields=['returned_at'], name='bookrequest_returned_idx'),
+            # pending requests oldest first: the librarian work queue
+            models.Index(fields=['is_approved', 'waitlisted', 'requested_at', 'id'], name='bookrequest_pending_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.user.username} requested {self.book.title}"
@@ -160,6 +231,190 @@ class BookRequest(models.Model):
         return timezone.now() > self.return_due_date
 
 
+# -----------------------
+# Book Request Archive Model
+# -----------------------
+
+class BookRequestArchive(models.Model):
+    """Returned BookRequests moved out of the active table by `manage.py archive_requests`, under their own ids."""
+    id = models.BigIntegerField(primary_key=True)
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='archived_requests')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_requests')
+    is_approved = models.BooleanField(default=True)
+    requested_at = models.DateTimeField()
+    approved_at = models.DateTimeField(null=True, blank=True)
+    return_due_date = models.DateTimeField(null=True, blank=True)
+    is_returned = models.BooleanField(default=True)
+    returned_at = models.DateTimeField(null=True, blank=True)
+    was_overdue = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # a student's history, in either keyset ordering
+            models.Index(fields=['student', 'requested_at', 'id'], name='bookrequestarchive_student_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} returned {self.book_id}"
+
+
+# -----------------------
+# Circulation Statistics Models
+# -----------------------
+
+class CirculationStat(models.Model):
+    """Current loan counts of one book, stream or student, kept by library/stats.py."""
+    BOOK, STREAM, STUDENT = 'book', 'stream', 'student'
+    SCOPE_CHOICES = [(BOOK, 'Book'), (STREAM, 'Stream'), (STUDENT, 'Student')]
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=20)  # book / stream id or roll number; '' = books without a stream
+    pending = models.IntegerField(default=0)
+    borrowed = models.IntegerField(default=0)  # approved, not returned
+    returned = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0)  # flagged by sweep_overdue, not returned
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='circulationstat_scope_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+class DailyCirculation(models.Model):
+    """Requests made, approved and returned per day, spread over a few rows per day (see library/stats.py)."""
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    requested = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    returned = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'shard'], name='dailycirculation_day_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} #{self.shard}"
+
+
+# -----------------------
+# Recommendation Models
+# -----------------------
+
+class CoBorrowCount(models.Model):
+    """Students who borrowed both `book` and `other`. The `book` == `other` row counts the book's own borrowers."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    students = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'other'], name='coborrowcount_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} & {self.other_id}: {self.students}"
+
+
+class SimilarBook(models.Model):
+    """Top books borrowed by the same students, precomputed by `manage.py build_recommendations`."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='similarbook_book_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} #{self.rank}: {self.similar_id}"
+
+
+class CoBorrowMark(models.Model):
+    """How far `build_recommendations` has read the approved loans, as the last (approved_at, id) counted."""
+    approved_at = models.DateTimeField(null=True, blank=True)
+    request_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.approved_at} / {self.request_id}"
+
+
+# -----------------------
+# Book Page Model
+# -----------------------
+
+class BookPage(models.Model):
+    """Plain text of one page of a Book's PDF, extracted in the background."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()  # 1-based
+    text = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('book', 'number')
+
+    def __str__(self):
+        return f"{self.book_id} p.{self.number}"
+
+
+# -----------------------
+# Book Term Model
+# -----------------------
+
+class BookTerm(models.Model):
+    """One term of a book's PDF text and the pages it occurs on (see library/content_search.py)."""
+    term = models.CharField(max_length=40)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='terms')
+    tf = models.PositiveIntegerField()  # occurrences in the whole book
+    pages = models.TextField()          # "page:count,page:count,..."
+
+    class Meta:
+        unique_together = ('term', 'book')
+
+    def __str__(self):
+        return f"{self.term} in {self.book_id}"
+
+
+# -----------------------
+# PDF Blob Model
+# -----------------------
+
+class PDFBlob(models.Model):
+    """One stored PDF or thumbnail file and how many books point at it (see library/storage.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+# -----------------------
+# PDF Upload Session Model
+# -----------------------
+
+class PDFUpload(models.Model):
+    """A resumable, chunked upload of a Book's PDF (see library/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pdf_uploads')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received = models.PositiveBigIntegerField(default=0)  # bytes written so far = next offset
+    is_complete = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
 
 
 from django.db.models.signals import post_delete
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import heapq
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# ----------------------------
+# Keyset (cursor) pagination
+# ----------------------------
+# Opt-in: list endpoints only paginate when `?cursor=` or `?page_size=` is
+# sent. Pages are fetched with `WHERE (key) > (last key seen) ORDER BY key
+# LIMIT n` on an indexed key, so page 10,000 costs the same as page 1.
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class Page:
+    def __init__(self, rows, next_cursor, prev_cursor):
+        self.rows = rows
+        self.next = next_cursor
+        self.prev = prev_cursor
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPaginator:
+    """
+    `orderings` maps the public `?ordering=` names to the key columns, which
+    must end in a unique column (the pk) so the key is a total order.
+    """
+
+    def __init__(self, orderings, default_ordering="id"):
+        self.orderings = orderings
+        self.default_ordering = default_ordering
+
+    @staticmethod
+    def is_requested(request):
+        return "cursor" in request.query_params or "page_size" in request.query_params
+
+    def get_page_size(self, request, default=None):
+        default = default or getattr(settings, "LIBRARY_PAGE_SIZE", 50)
+        maximum = getattr(settings, "LIBRARY_MAX_PAGE_SIZE", 500)
+        try:
+            size = int(request.query_params.get("page_size", default))
+        except ValueError:
+            size = default
+        return max(1, min(size, maximum))
+
+    def encode_cursor(self, ordering, direction, size, row, fields):
+        values = [_encode_value(row[f] if isinstance(row, dict) else getattr(row, f)) for f in fields]
+        payload = {"o": ordering, "d": direction, "s": size, "k": values}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, token, model):
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            ordering, direction, size, values = payload["o"], payload["d"], int(payload["s"]), payload["k"]
+            fields = self.orderings[ordering]
+            if direction not in ("next", "prev") or len(values) != len(fields):
+                raise InvalidCursor()
+            values = [model._meta.get_field(f).to_python(v) for f, v in zip(fields, values)]
+        except (InvalidCursor, ValueError, KeyError, TypeError, binascii.Error, ValidationError):
+            raise InvalidCursor("Invalid cursor.")
+        return ordering, direction, size, values
+
+    @staticmethod
+    def _after(fields, values, reverse=False):
+        # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), which index range scans handle
+        lookup = "lt" if reverse else "gt"
+        condition = Q()
+        for i, field in enumerate(fields):
+            term = Q(**{f"{field}__{lookup}": values[i]})
+            for prev_field, prev_value in zip(fields[:i], values[:i]):
+                term &= Q(**{prev_field: prev_value})
+            condition |= term
+        return condition
+
+    def paginate(self, queryset, request):
+        """
+        `queryset` may also be a list of querysets with the same fields and
+        disjoint keys (a table and its archive): each is read as if alone and
+        the page is their merge.
+        """
+        sources = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        token = request.query_params.get("cursor")
+        if token:
+            ordering, direction, size, values = self.decode_cursor(token, sources[0].model)
+            size = self.get_page_size(request, default=size)
+        else:
+            size = self.get_page_size(request)
+            ordering = request.query_params.get("ordering", self.default_ordering)
+            if ordering not in self.orderings:
+                raise InvalidCursor(f"Unknown ordering '{ordering}'.")
+            direction, values = "next", None
+        fields = self.orderings[ordering]
+
+        pages = []
+        for source in sources:
+            if direction == "next":
+                qs = source.order_by(*fields)
+                if values is not None:
+                    qs = qs.filter(self._after(fields, values))
+            else:
+                qs = source.order_by(*[f"-{f}" for f in fields]).filter(self._after(fields, values, reverse=True))
+            pages.append(list(qs[:size + 1]))
+
+        if len(pages) == 1:
+            rows = pages[0]
+        else:
+            key = lambda row: tuple(row[f] if isinstance(row, dict) else getattr(row, f) for f in fields)
+            rows = list(heapq.merge(*pages, key=key, reverse=direction == "prev"))[:size + 1]
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if direction == "prev":
+            rows.reverse()
+
+        if not rows:
+            return Page(rows, None, None)
+        # moving forward we came from an earlier page (if any); moving back we came from a later one
+        has_next = has_more if direction == "next" else True
+        has_prev = values is not None if direction == "next" else has_more
+        next_cursor = self.encode_cursor(ordering, "next", size, rows[-1], fields) if has_next else None
+        prev_cursor = self.encode_cursor(ordering, "prev", size, rows[0], fields) if has_prev else None
+        return Page(rows, next_cursor, prev_cursor)
+
+
+BOOK_ORDERINGS = {
+    "id": ("id",),
+    "title": ("title", "id"),
+}
+
+BOOK_REQUEST_ORDERINGS = {
+    "id": ("id",),
+    "requested_at": ("requested_at", "id"),
+}
@@ -0,0 +1,34 @@
+# ----------------------------
+# PDF extraction (page count, first-page thumbnail, page text)
+# ----------------------------
+# Kept free of Django imports: it runs in the worker processes of
+# library/pdf_processing.py, which don't set Django up. PyMuPDF is optional
+# (`pip install PyMuPDF`) and isn't thread-safe, which is why extraction runs
+# in processes rather than threads.
+
+try:
+    import pymupdf as fitz
+except ImportError:  # pragma: no cover - optional dependency
+    try:
+        import fitz  # PyMuPDF < 1.24
+    except ImportError:
+        fitz = None
+
+
+class ExtractionUnavailable(RuntimeError):
+    pass
+
+
+def extract(path, thumbnail_width=300):
+    """(page_count, thumbnail_png, [page_text, ...]) for the PDF at `path`."""
+    if fitz is None:
+        raise ExtractionUnavailable("PyMuPDF is not installed; PDFs can't be processed.")
+
+    with fitz.open(path) as doc:
+        thumbnail = None
+        if doc.page_count:
+            first = doc.load_page(0)
+            zoom = thumbnail_width / first.rect.width if first.rect.width else 1
+            thumbnail = first.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).tobytes("png")
+        pages = [page.get_text("text") for page in doc]
+        return doc.page_count, thumbnail, pages
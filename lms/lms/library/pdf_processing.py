@@ -0,0 +1,141 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import catalog_cache, content_search
+from .models import Book, BookPage
+from .pdf_extract import extract
+from . import storage
+from .storage import is_hashed
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Background PDF processing
+# ----------------------------
+# A changed Book.pdf is queued on commit. A small thread pool
+# (LIBRARY_PDF_WORKERS) takes the jobs, and each thread hands the actual
+# parsing to a process pool of the same size, so at most that many PDFs are
+# opened at once. The request that saved the PDF never waits.
+# Results are written only if the book still has the PDF that was processed,
+# so a replacement uploaded meanwhile wins. Thumbnails are named after the
+# PDF's content hash, and books sharing a PDF share the file; they are
+# reference-counted like the PDFs (library/storage.py), so a replaced PDF
+# or a deleted book frees its thumbnail once nothing else uses it.
+# Jobs still queued when the process stops remain `pending`;
+# `manage.py process_pdfs` picks them up.
+
+_lock = threading.Lock()
+_jobs = None
+_extractors = None
+
+
+def workers():
+    return getattr(settings, "LIBRARY_PDF_WORKERS", 2)
+
+
+def _pools():
+    global _jobs, _extractors
+    with _lock:
+        if _jobs is None:
+            _jobs = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix="pdf-processing")
+            # spawn, not fork: forking a process that holds DB connections and locks is unsafe
+            _extractors = ProcessPoolExecutor(max_workers=workers(), mp_context=multiprocessing.get_context("spawn"))
+    return _jobs, _extractors
+
+
+def queue(book_id):
+    """Process `book_id` once the current transaction commits."""
+    if workers() <= 0:
+        transaction.on_commit(lambda: process_book(book_id))
+        return
+    transaction.on_commit(lambda: _pools()[0].submit(_run_in_worker, book_id))
+
+
+def _run_in_worker(book_id):
+    try:
+        process_book(book_id, extractor=_pools()[1])
+    except Exception:
+        logger.exception("Processing the PDF of book %s failed", book_id)
+    finally:
+        connections.close_all()  # this thread's connections, not the request's
+
+
+def thumbnail_name(pdf_name):
+    digest = os.path.splitext(os.path.basename(pdf_name))[0]
+    return f"{Book._meta.get_field('thumbnail').upload_to}{digest}.png"
+
+
+def save_thumbnail(pdf_name, png):
+    """Store the thumbnail of `pdf_name` and return its name. Call inside a transaction."""
+    thumbnails = Book._meta.get_field("thumbnail").storage
+    name = thumbnail_name(pdf_name)
+    # only a content-hash name identifies the PDF; others get a fresh file
+    if is_hashed(pdf_name):
+        storage.lock_blob(name)  # so collect can't delete it until our reference commits
+        if thumbnails.exists(name):
+            return name
+    return thumbnails.save(name, ContentFile(png))
+
+
+def process_book(book_id, extractor=None):
+    row = Book.objects.filter(pk=book_id).values("pdf", "stream_id").first()
+    if not row or not row["pdf"]:
+        return False
+    name = row["pdf"]
+    path = Book._meta.get_field("pdf").storage.path(name)
+    width = getattr(settings, "LIBRARY_PDF_THUMBNAIL_WIDTH", 300)
+
+    try:
+        if extractor is None:
+            page_count, png, pages = extract(path, width)
+        else:
+            page_count, png, pages = extractor.submit(extract, path, width).result()
+    except Exception:
+        logger.exception("Could not read the PDF of book %s (%s)", book_id, name)
+        Book.objects.filter(pk=book_id, pdf=name).update(pdf_status=Book.PDF_FAILED)
+        return False
+
+    with transaction.atomic():
+        # lock the book and make sure the PDF we read is still its PDF
+        previous = Book.objects.select_for_update().filter(pk=book_id, pdf=name).values_list("thumbnail", flat=True)
+        if not previous:
+            return False
+        previous, thumbnail = previous[0] or "", ""
+        if png:
+            thumbnail = save_thumbnail(name, png)
+        if thumbnail != previous:
+            storage.add_reference(thumbnail)
+            storage.drop_reference(previous)
+        BookPage.objects.filter(book_id=book_id).delete()
+        BookPage.objects.bulk_create(
+            (BookPage(book_id=book_id, number=n, text=text) for n, text in enumerate(pages, start=1)),
+            batch_size=500,
+        )
+        content_search.index_book(book_id, enumerate(pages, start=1))
+        Book.objects.filter(pk=book_id).update(
+            page_count=page_count, thumbnail=thumbnail, pdf_status=Book.PDF_READY, updated_at=timezone.now()
+        )
+        catalog_cache.bump_books(row["stream_id"])
+    return True
+
+
+def reset(book):
+    """Mark derived data stale after Book.pdf changed (called from the Book signals)."""
+    has_pdf = bool(book.pdf)
+    # a locking read, so a thumbnail stored meanwhile by process_book is seen
+    previous = Book.objects.select_for_update().filter(pk=book.pk).values_list("thumbnail", flat=True).first()
+    book.pdf_status, book.page_count, book.thumbnail = (Book.PDF_PENDING if has_pdf else ""), None, ""
+    Book.objects.filter(pk=book.pk).update(pdf_status=book.pdf_status, page_count=None, thumbnail="")
+    storage.drop_reference(previous)
+    BookPage.objects.filter(book_id=book.pk).delete()  # text of the old PDF
+    content_search.remove_book(book.pk)
+    if has_pdf:
+        queue(book.pk)
@@ -0,0 +1,175 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import BookRequest, BookRequestArchive, CoBorrowCount, CoBorrowMark, SimilarBook
+
+# ----------------------------
+# Co-borrowing recommendations
+# ----------------------------
+# "Students who borrowed this also borrowed" is precomputed offline by
+# `manage.py build_recommendations` so /api/books/<pk>/similar/ is one
+# indexed read of SimilarBook.
+#
+# CoBorrowCount is a sparse, symmetric book x book matrix: (a, b) counts
+# the students who borrowed both a and b, and the diagonal (a, a) counts
+# a's borrowers; a student borrowing the same book twice counts once.
+# `build` reads approved loans from both request tables in (approved_at, id)
+# order after the high-water mark in CoBorrowMark, one batch at a time.
+# For each batch it loads the earlier books of just the batch's students,
+# adds up the new pairs in memory, writes them with a few set-based
+# UPDATEs (one per distinct increment), rescores the touched books and
+# moves the mark, all in one transaction, so memory is bounded by the
+# batch and an interrupted run resumes where it stopped.
+#
+# A book's similarity to another is the cosine of their borrower sets,
+# both / sqrt(borrowers(a) * borrowers(b)), keeping the
+# LIBRARY_RECOMMENDATION_TOP_K best pairs seen by at least
+# LIBRARY_RECOMMENDATION_MIN_STUDENTS students. Loans approved in the last
+# LIBRARY_RECOMMENDATION_LAG_SECONDS are left for the next run so a
+# transaction still committing an earlier approved_at can't be skipped.
+# Only books whose own pairs changed are rescored, so a neighbour's score
+# can lag its new borrowers a little; `--rebuild` recomputes everything.
+
+SOURCES = (BookRequest, BookRequestArchive)
+
+
+def top_k():
+    return getattr(settings, "LIBRARY_RECOMMENDATION_TOP_K", 10)
+
+
+def min_students():
+    return getattr(settings, "LIBRARY_RECOMMENDATION_MIN_STUDENTS", 2)
+
+
+def batch_size():
+    return getattr(settings, "LIBRARY_RECOMMENDATION_BATCH", 10000)
+
+
+def lag():
+    return timedelta(seconds=getattr(settings, "LIBRARY_RECOMMENDATION_LAG_SECONDS", 300))
+
+
+def _after(mark):
+    if mark.approved_at is None:
+        return Q()
+    return Q(approved_at__gt=mark.approved_at) | Q(approved_at=mark.approved_at, id__gt=mark.request_id)
+
+
+def _next_batch(mark, until, size):
+    """The next `size` approvals after `mark` as (approved_at, id, student_id, book_id), oldest first."""
+    batches = [
+        model.objects.filter(_after(mark), approved_at__isnull=False, approved_at__lte=until)
+        .order_by("approved_at", "id").values_list("approved_at", "id", "student_id", "book_id")[:size]
+        for model in SOURCES
+    ]
+    return list(heapq.merge(*batches))[:size]
+
+
+def _counted_books(mark, students):
+    """{student_id: set of book ids} already counted, i.e. approved up to `mark`."""
+    books = defaultdict(set)
+    if mark.approved_at is None:
+        return books
+    for model in SOURCES:
+        rows = (
+            model.objects.filter(student_id__in=students, approved_at__isnull=False).exclude(_after(mark))
+            .values_list("student_id", "book_id").distinct()
+        )
+        for student_id, book_id in rows:
+            books[student_id].add(book_id)
+    return books
+
+
+def _pairs(loans, history):
+    """Count the new (book, other) pairs, both ways round, and each new borrower on the diagonal."""
+    pairs = Counter()
+    for _, _, student_id, book_id in loans:
+        seen = history[student_id]
+        if book_id in seen:
+            continue
+        pairs[(book_id, book_id)] += 1
+        for other in seen:
+            pairs[(book_id, other)] += 1
+            pairs[(other, book_id)] += 1
+        seen.add(book_id)
+    return pairs
+
+
+def _add_pairs(pairs):
+    CoBorrowCount.objects.bulk_create(
+        (CoBorrowCount(book_id=book_id, other_id=other_id) for book_id, other_id in pairs),
+        ignore_conflicts=True, batch_size=1000,
+    )
+    by_delta = defaultdict(lambda: defaultdict(list))  # delta -> book -> others
+    for (book_id, other_id), delta in pairs.items():
+        by_delta[delta][book_id].append(other_id)
+    for delta, books in by_delta.items():
+        books = list(books.items())
+        for start in range(0, len(books), 500):
+            condition = Q()
+            for book_id, others in books[start:start + 500]:
+                condition |= Q(book_id=book_id, other_id__in=others)
+            CoBorrowCount.objects.filter(condition).update(students=F("students") + delta)
+
+
+def rescore(book_ids):
+    """Recompute the SimilarBook rows of `book_ids` from the pair counts."""
+    book_ids, k, least = sorted(book_ids), top_k(), min_students()
+    for start in range(0, len(book_ids), 500):
+        chunk = book_ids[start:start + 500]
+        pairs = defaultdict(list)
+        for book_id, other_id, both in (
+            CoBorrowCount.objects.filter(book_id__in=chunk, students__gte=least)
+            .exclude(other_id=F("book_id")).values_list("book_id", "other_id", "students")
+        ):
+            pairs[book_id].append((other_id, both))
+        borrowers = dict(
+            CoBorrowCount.objects.filter(
+                book_id__in=set(chunk).union(*({o for o, _ in p} for p in pairs.values())), other_id=F("book_id")
+            ).values_list("book_id", "students")
+        )
+        rows = []
+        for book_id, others in pairs.items():
+            scored = (
+                (both / math.sqrt(borrowers[book_id] * borrowers[other_id]), -other_id) for other_id, both in others
+            )
+            for rank, (score, other_id) in enumerate(heapq.nlargest(k, scored), 1):
+                rows.append(SimilarBook(book_id=book_id, similar_id=-other_id, rank=rank, score=round(score, 6)))
+        SimilarBook.objects.filter(book_id__in=chunk).delete()
+        SimilarBook.objects.bulk_create(rows, batch_size=1000)
+
+
+def build(size=None, rebuild=False, until=None):
+    """Count approvals since the last run and rescore the books they touch. Returns (loans, books rescored).
+    `rebuild` starts over from no counts and scores every book once at the end."""
+    size, until = size or batch_size(), until or timezone.now() - lag()
+    if rebuild:
+        with transaction.atomic():
+            CoBorrowCount.objects.all().delete()
+            SimilarBook.objects.all().delete()
+            CoBorrowMark.objects.all().delete()
+    counted, touched = 0, set()
+    while True:
+        with transaction.atomic():
+            mark, _ = CoBorrowMark.objects.select_for_update().get_or_create(pk=1)
+            loans = _next_batch(mark, until, size)
+            if not loans:
+                if rebuild:
+                    rescore(touched)
+                return counted, len(touched)
+            pairs = _pairs(loans, _counted_books(mark, {loan[2] for loan in loans}))
+            _add_pairs(pairs)
+            books = {book_id for book_id, _ in pairs}
+            if not rebuild:
+                rescore(books)
+            mark.approved_at, mark.request_id = loans[-1][0], loans[-1][1]
+            mark.save()
+        counted += len(loans)
+        touched |= books
@@ -0,0 +1,345 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from . import catalog_cache
+
+# ----------------------------
+# Catalog search backends
+# ----------------------------
+# `?search=` on the book list goes through one of these instead of
+# `icontains`, so lookups hit an index rather than scanning every row.
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+TITLE_WEIGHT = 2.0
+AUTHOR_WEIGHT = 1.0
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+class BaseSearchBackend:
+    def search(self, queryset, query):
+        """Return `queryset` narrowed to books matching `query`, best match first."""
+        raise NotImplementedError
+
+    def fallback(self, queryset, query):
+        # plain substring match, used when the query has nothing indexable
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(author__name__icontains=query)
+        )
+
+    # index maintenance hooks, called from library.signals
+    def index_book(self, book):
+        pass
+
+    def remove_book(self, book_id):
+        pass
+
+    def index_author(self, author):
+        pass
+
+    def remove_author(self, author_id):
+        pass
+
+    def invalidate(self):
+        # called after bulk writes that bypass the signals
+        pass
+
+
+class SharedGenerationIndex:
+    """
+    Bookkeeping for an index each worker process holds in memory. A process
+    applies its own Book/Author changes in place and bumps the index's shared
+    generation (library/catalog_cache.py); a process that finds a generation
+    it didn't apply itself rebuilds before its next lookup. Subclasses set
+    `index_name` and implement `_reset` and `_load`.
+    """
+
+    index_name = None
+
+    def _init_index(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._generation = None
+        self._reset()
+
+    def rebuild(self):
+        with self._lock:
+            # read first: a change committed during the load bumps past it
+            self._generation = catalog_cache.index_generation(self.index_name)
+            self._reset()
+            self._load()
+            self._built = True
+
+    def invalidate(self):
+        # called after bulk writes that bypass the signals
+        with self._lock:
+            catalog_cache.bump_index(self.index_name)
+            self._built = False
+            self._reset()
+
+    def _ensure_built(self):
+        if not self._built or catalog_cache.index_generation(self.index_name) != self._generation:
+            self.rebuild()
+
+    def _changed(self):
+        # after applying this process's own change; keep the index only if
+        # no other process changed it since it was last current
+        generation = catalog_cache.bump_index(self.index_name)
+        if self._built and generation != self._generation + 1:
+            self._built = False
+            self._reset()
+        self._generation = generation
+
+
+class InProcessSearchBackend(SharedGenerationIndex, BaseSearchBackend):
+    """
+    Inverted index over Book.title and Author.name held in process memory.
+    Built lazily from the database on first search, kept current by the
+    Book/Author signals and rebuilt when another worker changed the catalog.
+    Every search reads one cache key, so use a shared cache across workers.
+    """
+
+    index_name = "search"
+
+    def __init__(self, max_results=None):
+        self.max_results = max_results or getattr(settings, "LIBRARY_SEARCH_MAX_RESULTS", 1000)
+        self._init_index()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)    # token -> {book_id: weight}
+        self._vocabulary = []                 # sorted tokens, for prefix lookups
+        self._book_tokens = {}                # book_id -> {token: weight}
+        self._book_titles = {}                # book_id -> title
+        self._book_author = {}                # book_id -> author_id
+        self._author_books = defaultdict(set) # author_id -> {book_id}
+        self._author_names = {}               # author_id -> name
+
+    def _load(self):
+        from .models import Book
+
+        rows = Book.objects.values_list("id", "title", "author_id", "author__name")
+        for book_id, title, author_id, author_name in rows.iterator(chunk_size=2000):
+            self._author_names[author_id] = author_name
+            self._add(book_id, title, author_id)
+
+    def _document_tokens(self, title, author_name):
+        weights = {}
+        for token in tokenize(title):
+            weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(author_name):
+            weights[token] = weights.get(token, 0) + AUTHOR_WEIGHT
+        return weights
+
+    def _add(self, book_id, title, author_id):
+        weights = self._document_tokens(title, self._author_names.get(author_id))
+        for token, weight in weights.items():
+            posting = self._postings[token]
+            if not posting:
+                bisect.insort(self._vocabulary, token)
+            posting[book_id] = weight
+        self._book_tokens[book_id] = weights
+        self._book_titles[book_id] = title
+        self._book_author[book_id] = author_id
+        self._author_books[author_id].add(book_id)
+
+    def _discard(self, book_id):
+        self._book_titles.pop(book_id, None)
+        for token in self._book_tokens.pop(book_id, {}):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(book_id, None)
+            if not posting:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocabulary, token)
+                if i < len(self._vocabulary) and self._vocabulary[i] == token:
+                    del self._vocabulary[i]
+        author_id = self._book_author.pop(book_id, None)
+        if author_id is not None:
+            self._author_books[author_id].discard(book_id)
+
+    def index_book(self, book):
+        with self._lock:
+            if self._built:
+                self._discard(book.pk)
+                self._author_names[book.author_id] = book.author.name
+                self._add(book.pk, book.title, book.author_id)
+            self._changed()
+
+    def remove_book(self, book_id):
+        with self._lock:
+            if self._built:
+                self._discard(book_id)
+            self._changed()
+
+    def index_author(self, author):
+        with self._lock:
+            if self._built:
+                self._author_names[author.pk] = author.name
+                for book_id in list(self._author_books.get(author.pk, ())):
+                    title = self._book_titles[book_id]
+                    self._discard(book_id)
+                    self._add(book_id, title, author.pk)
+            self._changed()
+
+    def remove_author(self, author_id):
+        with self._lock:
+            if self._built:
+                for book_id in list(self._author_books.pop(author_id, ())):
+                    self._discard(book_id)
+                self._author_names.pop(author_id, None)
+            self._changed()
+
+    def _matches(self, token, prefix):
+        if not prefix:
+            return self._postings.get(token, {})
+        # last token is matched as a prefix so results follow the user's typing
+        merged = {}
+        i = bisect.bisect_left(self._vocabulary, token)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(token):
+            candidate = self._vocabulary[i]
+            bonus = 1.0 if candidate == token else 0.5
+            for book_id, weight in self._postings[candidate].items():
+                score = weight * bonus
+                if score > merged.get(book_id, 0):
+                    merged[book_id] = score
+            i += 1
+        return merged
+
+    def scores(self, query):
+        """{book_id: score} for the best `max_results` matches, or None if nothing indexable."""
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        with self._lock:
+            self._ensure_built()
+            scores = None
+            for n, token in enumerate(tokens):
+                matches = self._matches(token, prefix=(n == len(tokens) - 1))
+                if scores is None:
+                    scores = dict(matches)
+                else:
+                    scores = {
+                        book_id: score + matches[book_id]
+                        for book_id, score in scores.items()
+                        if book_id in matches
+                    }
+                if not scores:
+                    return {}
+        if len(scores) > self.max_results:
+            best = heapq.nsmallest(self.max_results, scores.items(), key=lambda item: (-item[1], item[0]))
+            scores = dict(best)
+        return scores
+
+    def search(self, queryset, query):
+        scores = self.scores(query)
+        if scores is None:
+            return self.fallback(queryset, query)
+        if not scores:
+            return queryset.none()
+        # scores are sums of a few field weights, so there are only a handful
+        # of distinct values: one WHEN per score bucket rather than per book
+        buckets = defaultdict(list)
+        for book_id, score in scores.items():
+            buckets[score].append(book_id)
+        rank = Case(
+            *[When(pk__in=ids, then=Value(score)) for score, ids in buckets.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return (
+            queryset
+            .filter(pk__in=list(scores))
+            .annotate(search_score=rank)
+            .order_by("-search_score", "id")
+        )
+
+
+class MySQLFullTextSearchBackend(BaseSearchBackend):
+    """
+    Uses the FULLTEXT indexes on library_book.title and library_author.name
+    (migration 0007). InnoDB maintains them itself, so the index hooks stay
+    no-ops. Like the in-process index, every token must match the title or
+    the author name, and the last one is matched as a prefix.
+    """
+
+    min_token_size = 3  # innodb_ft_min_token_size default
+    # INNODB_FT_DEFAULT_STOPWORD: never indexed, so never required
+    stopwords = frozenset(
+        "a about an are as at be by com de en for from how i in is it la of on or "
+        "that the this to was what when where who will with und www".split()
+    )
+
+    def boolean_terms(self, query):
+        tokens = tokenize(query)
+        return [
+            f"{token}*" if n == len(tokens) - 1 else token
+            for n, token in enumerate(tokens)
+            if len(token) >= self.min_token_size and token not in self.stopwords
+        ]
+
+    def search(self, queryset, query):
+        terms = self.boolean_terms(query)
+        if not terms:
+            return self.fallback(queryset, query)
+        # one indexed lookup per field and token, ANDed over the tokens, so
+        # "tolkien hobbit" finds a book by its author and title together
+        matches = Q()
+        for term in terms:
+            matches &= Q(pk__in=RawSQL(
+                "SELECT id FROM library_book WHERE MATCH(title) AGAINST (%s IN BOOLEAN MODE)", (term,),
+            )) | Q(author_id__in=RawSQL(
+                "SELECT id FROM library_author WHERE MATCH(name) AGAINST (%s IN BOOLEAN MODE)", (term,),
+            ))
+        against = " ".join(terms)  # no operators: scores any of the tokens
+        title_match = "MATCH(library_book.title) AGAINST (%s IN BOOLEAN MODE)"
+        author_match = (
+            "(SELECT MATCH(a.name) AGAINST (%s IN BOOLEAN MODE) "
+            "FROM library_author a WHERE a.id = library_book.author_id)"
+        )
+        score = RawSQL(
+            f"{title_match} * {TITLE_WEIGHT} + COALESCE({author_match}, 0) * {AUTHOR_WEIGHT}",
+            (against, against),
+        )
+        return (
+            queryset
+            .filter(matches)
+            .annotate(search_score=score)
+            .order_by("-search_score", "id")
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """
+    Returns the configured backend (settings.LIBRARY_SEARCH_BACKEND, a dotted
+    path), defaulting to FULLTEXT on MySQL and the in-process index elsewhere.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, "LIBRARY_SEARCH_BACKEND", None)
+                if path:
+                    _backend = import_string(path)()
+                elif connection.vendor == "mysql":
+                    _backend = MySQLFullTextSearchBackend()
+                else:
+                    _backend = InProcessSearchBackend()
+    return _backend
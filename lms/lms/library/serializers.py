@@ -2,11 +2,14 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
-from .models import StudentProfile, Book, BookRequest,CustomUser,Stream
+from .models import StudentProfile, Book, BookRequest, BookRequestArchive,CustomUser,Stream
 from rest_framework.exceptions import ValidationError
 import re
 User = get_user_model()
 from django.utils import timezone
+from django.urls import reverse
+from urllib.parse import quote, urlencode
+from .downloads import sign_download
 # ------------------------------
 # Register Serializer
 # ------------------------------
@@ -173,15 +176,20 @@ class StudentProfileSerializer(serializers.ModelSerializer):
 class BookSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.name', read_only=True)
     stream_name = serializers.CharField(source='stream.name', read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'author', 'author_name',
             'stream', 'stream_name', 'publication_date', 'quantity',
-            'created_at', 'created_by', 'updated_at', 'updated_by'
+            'created_at', 'created_by', 'updated_at', 'updated_by',
+            'page_count', 'thumbnail_url'
         ]
-        read_only_fields = ['created_by', 'updated_by']
+        read_only_fields = ['created_by', 'updated_by', 'page_count']
+
+    def get_thumbnail_url(self, obj):
+        return obj.thumbnail.url if obj.thumbnail else None
 
 
 class StreamSerializer(serializers.ModelSerializer):
@@ -194,8 +202,29 @@ class StreamSerializer(serializers.ModelSerializer):
 # ------------------------------
 
 
+class PrefetchedBookField(serializers.PrimaryKeyRelatedField):
+    """
+    Book primary key field that resolves ids from `context['books']` (an
+    `in_bulk` result) when given, so validating a batch doesn't run one
+    query per item. Unknown ids fail with DRF's usual errors.
+    """
+
+    def to_internal_value(self, data):
+        books = self.context.get('books')
+        if books is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            return super().to_internal_value(data)
+        if pk in books:
+            return books[pk]
+        self.fail('does_not_exist', pk_value=data)
+
+
 class BookRequestSerializer(serializers.ModelSerializer):
     student = serializers.StringRelatedField(read_only=True)
+    book = PrefetchedBookField(queryset=Book.objects.all())
     book_title = serializers.CharField(source='book.title', read_only=True)
     pdf_url = serializers.SerializerMethodField()
     is_overdue = serializers.SerializerMethodField()   # compute on serializer side
@@ -207,12 +236,12 @@ class BookRequestSerializer(serializers.ModelSerializer):
             'id', 'student', 'book', 'book_title',
             'is_approved', 'requested_at', 'approved_at',
             'return_due_date', 'is_returned', 'returned_at',
-            'is_overdue', 'pdf_url','was_overdue'
+            'is_overdue', 'pdf_url','was_overdue', 'waitlisted'
         ]
         read_only_fields = [
             'is_approved', 'requested_at', 'approved_at',
             'return_due_date', 'is_returned', 'returned_at',
-            'is_overdue', 'pdf_url','was_overdue'
+            'is_overdue', 'pdf_url','was_overdue', 'waitlisted'
         ]
 
     def get_is_overdue(self, obj):
@@ -222,9 +251,176 @@ class BookRequestSerializer(serializers.ModelSerializer):
 
     def get_pdf_url(self, obj):
         if obj.is_approved and obj.book and obj.book.pdf:
+            # protected download endpoint, signed for the borrower
+            url = reverse('book-pdf', kwargs={'pk': obj.book_id})
+            url += '?' + urlencode({'sig': sign_download(obj.book_id, obj.student.user_id)})
             request = self.context.get("request")
             if request:
-                return request.build_absolute_uri(obj.book.pdf.url)
-            return obj.book.pdf.url
+                return request.build_absolute_uri(url)
+            return url
         return None
 
+
+
+# ------------------------------
+# Fast list serializers (read-only)
+# ------------------------------
+# Same JSON as BookSerializer / BookRequestSerializer with many=True, but
+# built from one `.values()` query with the related names joined in SQL, so
+# no model instances or per-row field machinery are involved.
+from django.conf import settings
+from django.db.models import F, Value
+from django.utils.encoding import filepath_to_uri
+from rest_framework.settings import api_settings, ISO_8601
+
+
+def datetime_formatter():
+    """
+    Equivalent of DateTimeField().to_representation with the timezone looked
+    up once instead of per value (it dominates the cost of a list response).
+    """
+    if api_settings.DATETIME_FORMAT is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    tz = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def to_representation(value):
+        if not value:
+            return None
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return to_representation
+
+
+class ValuesListSerializer:
+    columns = ()  # output keys, in order (CSV header for exports)
+    values_fields = ()
+    values_expressions = {}
+
+    def __init__(self, instance, context=None):
+        # `instance` is a queryset, or rows already fetched with `values()`
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.values_fields, **cls.values_expressions)
+
+    def get_rows(self):
+        if hasattr(self.instance, 'values'):
+            return self.values(self.instance).iterator(chunk_size=2000)
+        return self.instance
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.get_rows()]
+
+
+class BookValuesListSerializer(ValuesListSerializer):
+    columns = (
+        'id', 'title', 'author', 'author_name', 'stream', 'stream_name', 'publication_date',
+        'quantity', 'created_at', 'created_by', 'updated_at', 'updated_by', 'page_count', 'thumbnail_url',
+    )
+    values_fields = (
+        'id', 'title', 'author_id', 'stream_id', 'publication_date', 'quantity',
+        'created_at', 'created_by_id', 'updated_at', 'updated_by_id', 'page_count', 'thumbnail',
+    )
+    values_expressions = {
+        'author_name': F('author__name'),
+        'stream_name': F('stream__name'),
+    }
+
+    def __init__(self, instance, context=None):
+        super().__init__(instance, context)
+        self.date = serializers.DateField().to_representation
+        self.datetime = datetime_formatter()
+        # resolve the media prefix once instead of storage.url per row
+        self.thumbnail_prefix = Book._meta.get_field('thumbnail').storage.url('')
+
+    def to_representation(self, row):
+        rep = {
+            'id': row['id'],
+            'title': row['title'],
+            'author': row['author_id'],
+            'author_name': row['author_name'],
+            'stream': row['stream_id'],
+            'stream_name': row['stream_name'],
+            'publication_date': self.date(row['publication_date']),
+            'quantity': row['quantity'],
+            'created_at': self.datetime(row['created_at']),
+            'created_by': row['created_by_id'],
+            'updated_at': self.datetime(row['updated_at']),
+            'updated_by': row['updated_by_id'],
+            'page_count': row['page_count'],
+            'thumbnail_url': self.thumbnail_prefix + filepath_to_uri(row['thumbnail']) if row['thumbnail'] else None,
+        }
+        if row['stream_id'] is None:
+            # BookSerializer skips `stream.name` when the stream is unset
+            del rep['stream_name']
+        return rep
+
+
+class BookRequestValuesListSerializer(ValuesListSerializer):
+    columns = (
+        'id', 'student', 'book', 'book_title', 'is_approved', 'requested_at', 'approved_at',
+        'return_due_date', 'is_returned', 'returned_at', 'is_overdue', 'pdf_url', 'was_overdue', 'waitlisted',
+    )
+    values_fields = (
+        'id', 'student_id', 'book_id', 'is_approved', 'requested_at', 'approved_at',
+        'return_due_date', 'is_returned', 'returned_at', 'was_overdue', 'waitlisted',
+    )
+    values_expressions = {
+        'book_title': F('book__title'),
+        'book_pdf': F('book__pdf'),
+        'student_user_id': F('student__user_id'),
+    }
+
+    @classmethod
+    def values(cls, queryset):
+        if queryset.model is BookRequestArchive:
+            # archived requests were returned long ago and are never waitlisted
+            fields = [f for f in cls.values_fields if f != 'waitlisted']
+            return queryset.values(*fields, waitlisted=Value(False), **cls.values_expressions)
+        return super().values(queryset)
+
+    def __init__(self, instance, context=None):
+        super().__init__(instance, context)
+        self.datetime = datetime_formatter()
+        self.now = timezone.now()
+        # resolve the download URL once instead of reverse + build_absolute_uri per row
+        path = reverse('book-pdf', kwargs={'pk': 0})
+        request = self.context.get('request')
+        url = request.build_absolute_uri(path) if request else path
+        self.pdf_head, _, tail = url.rpartition('/0/')
+        self.pdf_tail = '/' + tail + '?sig='
+
+    def to_representation(self, row):
+        due = row['return_due_date']
+        approved, returned = row['is_approved'], row['is_returned']
+        pdf = row['book_pdf']
+        return {
+            'id': row['id'],
+            'student': row['student_id'],  # StudentProfile.__str__ is its id (roll number)
+            'book': row['book_id'],
+            'book_title': row['book_title'],
+            'is_approved': approved,
+            'requested_at': self.datetime(row['requested_at']),
+            'approved_at': self.datetime(row['approved_at']),
+            'return_due_date': self.datetime(due),
+            'is_returned': returned,
+            'returned_at': self.datetime(row['returned_at']),
+            'is_overdue': bool(approved and not returned and due and self.now > due),
+            'pdf_url': self.pdf_link(row) if approved and pdf else None,
+            'was_overdue': row['was_overdue'],
+            'waitlisted': row['waitlisted'],
+        }
+
+    def pdf_link(self, row):
+        sig = sign_download(row['book_id'], row['student_user_id'])
+        return f"{self.pdf_head}/{row['book_id']}{self.pdf_tail}{quote(sig, safe='')}"
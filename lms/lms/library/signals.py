@@ -8,3 +8,178 @@ from rest_framework.authtoken.models import Token
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.get_or_create(user=instance)
+
+
+# ----------------------------
+# Keep the catalog search and typeahead indexes current
+# ----------------------------
+# Updates run on commit so a rolled-back save never reaches the index.
+from django.db import transaction
+from django.db.models.signals import post_delete
+from .models import Author, Book, Stream
+from .search import get_search_backend
+from .suggest import get_suggest_index
+
+
+def catalog_indexes():
+    return (get_search_backend(), get_suggest_index())
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    def update():
+        for index in catalog_indexes():
+            index.index_book(instance)
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def update():
+        for index in catalog_indexes():
+            index.remove_book(pk)
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Author)
+def index_author(sender, instance, **kwargs):
+    def update():
+        for index in catalog_indexes():
+            index.index_author(instance)
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Author)
+def unindex_author(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def update():
+        for index in catalog_indexes():
+            index.remove_author(pk)
+    transaction.on_commit(update)
+
+
+# ----------------------------
+# Invalidate the cached catalog lists
+# ----------------------------
+from django.db.models.signals import pre_save
+from . import catalog_cache
+
+
+@receiver(pre_save, sender=Book)
+def remember_book_state(sender, instance, **kwargs):
+    # a book moving streams must drop out of its old stream's cached list,
+    # a replaced PDF loses a reference, and raised stock serves the waitlist
+    instance._previous_stream_id = instance._previous_pdf = instance._previous_quantity = None
+    if instance.pk:
+        previous = Book.objects.filter(pk=instance.pk).values_list('stream_id', 'pdf', 'quantity').first()
+        if previous:
+            instance._previous_stream_id, instance._previous_pdf, instance._previous_quantity = previous
+
+
+@receiver(post_save, sender=Book)
+def invalidate_book_lists(sender, instance, **kwargs):
+    catalog_cache.bump_books(instance.stream_id, getattr(instance, '_previous_stream_id', None))
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_book_lists_on_delete(sender, instance, **kwargs):
+    catalog_cache.bump_books(instance.stream_id)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Stream)
+@receiver(post_delete, sender=Stream)
+def invalidate_catalog_names(sender, instance, **kwargs):
+    catalog_cache.bump_meta()
+
+
+# ----------------------------
+# Hand raised stock to the waitlist
+# ----------------------------
+from . import loans
+
+
+@receiver(post_save, sender=Book)
+def serve_waitlist(sender, instance, created, **kwargs):
+    # inside Book.save's transaction; the waiting requests take the new copies
+    previous = getattr(instance, '_previous_quantity', None)
+    if not created and previous is not None and instance.quantity > previous:
+        instance.quantity -= loans.serve_waitlist([instance.pk]).get(instance.pk, 0)
+
+
+# ----------------------------
+# Reference-count stored PDFs and queue their processing
+# ----------------------------
+from . import pdf_processing, storage
+
+
+@receiver(post_save, sender=Book)
+def count_pdf_references(sender, instance, **kwargs):
+    previous, current = getattr(instance, '_previous_pdf', None) or '', instance.pdf.name or ''
+    if previous != current:
+        storage.add_reference(current)
+        storage.drop_reference(previous)
+        pdf_processing.reset(instance)
+
+
+@receiver(post_delete, sender=Book)
+def release_pdf_reference(sender, instance, **kwargs):
+    storage.drop_reference(instance.pdf.name)
+    storage.drop_reference(instance.thumbnail.name)
+
+
+# ----------------------------
+# Take deleted requests off the circulation counters
+# ----------------------------
+# A book's or student's requests go with it (CASCADE). Before anything is
+# deleted, pre_delete takes all of them off with a few grouped queries and
+# notes the book or student on the deletion's `origin`; the requests'
+# post_delete then skips them. A request deleted on its own is taken off
+# by itself. Nothing is looked up under stats.keeping_counts().
+from django.db.models.signals import pre_delete
+from .models import BookRequest, BookRequestArchive, CirculationStat, StudentProfile
+from . import stats
+
+
+def _uncounted(origin):
+    # {field: ids} whose requests this deletion has already taken off
+    if not hasattr(origin, '_uncounted_requests'):
+        origin._uncounted_requests = {'book_id': set(), 'student_id': set()}
+    return origin._uncounted_requests
+
+
+@receiver(pre_delete, sender=Book)
+@receiver(pre_delete, sender=StudentProfile)
+def uncount_requests(sender, instance, origin=None, **kwargs):
+    if stats.is_keeping_counts():
+        return
+    field = 'book_id' if sender is Book else 'student_id'
+    stats.forget(**{field: instance.pk})
+    _uncounted(origin)[field].add(instance.pk)
+
+
+@receiver(post_delete, sender=BookRequest)
+@receiver(post_delete, sender=BookRequestArchive)
+def uncount_request(sender, instance, origin=None, **kwargs):
+    if stats.is_keeping_counts():
+        return
+    uncounted = getattr(origin, '_uncounted_requests', None)
+    if uncounted and (instance.book_id in uncounted['book_id'] or instance.student_id in uncounted['student_id']):
+        return
+    if sender.book.is_cached(instance):
+        stream_id = instance.book.stream_id
+    else:
+        stream_id = Book.objects.filter(pk=instance.book_id).values_list('stream_id', flat=True).first()
+    stats.remove(instance, stream_id)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=StudentProfile)
+def drop_circulation_row(sender, instance, **kwargs):
+    # its requests have been taken off already, leaving the row at zero
+    scope = CirculationStat.BOOK if sender is Book else CirculationStat.STUDENT
+    CirculationStat.objects.filter(scope=scope, key=str(instance.pk)).delete()
@@ -0,0 +1,254 @@
+import operator
+import random
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BookRequest, BookRequestArchive, CirculationStat, DailyCirculation, Stream
+
+# ----------------------------
+# Circulation statistics
+# ----------------------------
+# Dashboards read counters instead of counting loans. Every state change in
+# library/loans.py and the request views adds to them in its own
+# transaction: CirculationStat holds the current pending / borrowed /
+# returned / overdue counts of each book, stream and student, and
+# DailyCirculation the requests, approvals and returns of each day.
+# A change touches its rows with one set-based UPDATE. Library-wide totals
+# are summed from the stream rows rather than kept in one row every
+# transaction would queue on, and each day is split over
+# LIBRARY_STATS_DAY_SHARDS rows for the same reason.
+# Deleting a request, directly or along with its book or student, takes it
+# off again through delete signal handlers (library/signals.py), except where
+# rows move to the archive under `keeping_counts()`.
+# `manage.py rebuild_stats` recomputes everything with grouped aggregates.
+
+COUNTERS = ("pending", "borrowed", "returned", "overdue")
+DAY_COUNTERS = ("requested", "approved", "returned")
+
+
+def day_shards():
+    return getattr(settings, "LIBRARY_STATS_DAY_SHARDS", 8)
+
+
+def _keys(rows):
+    counts = Counter()
+    for row in rows:
+        counts[(CirculationStat.BOOK, str(row["book_id"]))] += 1
+        counts[(CirculationStat.STREAM, str(row["stream_id"] or ""))] += 1
+        counts[(CirculationStat.STUDENT, str(row["student_id"]))] += 1
+    return counts
+
+
+def add(rows, **deltas):
+    """Add `deltas` (e.g. pending=-1, borrowed=1) for each loan in `rows`, dicts with
+    book_id, stream_id and student_id, to its book's, stream's and student's counters."""
+    counts = _keys(rows)
+    if not counts or not any(deltas.values()):
+        return
+    CirculationStat.objects.bulk_create(
+        (CirculationStat(scope=scope, key=key) for scope, key in counts), ignore_conflicts=True
+    )
+    by_times = defaultdict(lambda: defaultdict(list))  # times -> scope -> keys
+    for (scope, key), times in counts.items():
+        by_times[times][scope].append(key)
+    conditions = {}
+    for times, scopes in by_times.items():
+        conditions[times] = Q()
+        for scope, keys in scopes.items():
+            conditions[times] |= Q(scope=scope, key__in=keys)
+    # one UPDATE for every row, each adding its delta times its count
+    CirculationStat.objects.filter(reduce(operator.or_, conditions.values())).update(**{
+        name: F(name) + Case(*(When(condition, then=Value(delta * times)) for times, condition in conditions.items()),
+                             default=Value(0))
+        for name, delta in deltas.items() if delta
+    })
+
+
+def add_daily(day=None, **counts):
+    """Count the events of `day` (today by default), e.g. add_daily(approved=3)."""
+    counts = {name: n for name, n in counts.items() if n}
+    if not counts:
+        return
+    day, shard = day or timezone.localdate(), random.randrange(day_shards())
+    DailyCirculation.objects.bulk_create([DailyCirculation(day=day, shard=shard)], ignore_conflicts=True)
+    DailyCirculation.objects.filter(day=day, shard=shard).update(**{name: F(name) + n for name, n in counts.items()})
+
+
+_keeping = ContextVar("keeping_counts", default=False)
+
+
+@contextmanager
+def keeping_counts():
+    """Delete requests without taking them off the counters, for rows that move rather than go."""
+    token = _keeping.set(True)
+    try:
+        yield
+    finally:
+        _keeping.reset(token)
+
+
+def is_keeping_counts():
+    return _keeping.get()
+
+
+SCOPE_KEYS = ((CirculationStat.BOOK, "book_id"), (CirculationStat.STREAM, "book__stream_id"),
+              (CirculationStat.STUDENT, "student_id"))
+DAY_FIELDS = (("requested", "requested_at"), ("approved", "approved_at"), ("returned", "returned_at"))
+
+
+def _rows(pairs):
+    by_scope = defaultdict(list)
+    for scope, key in pairs:
+        by_scope[scope].append(key)
+    return reduce(operator.or_, (Q(scope=scope, key__in=keys) for scope, keys in by_scope.items()))
+
+
+def _minus(counts, names, condition):
+    """{name: F(name) - CASE ...} taking counts[k][name] off the row(s) `condition([k, ...])` selects."""
+    updates = {}
+    for name in names:
+        by_n = defaultdict(list)
+        for k, row in counts.items():
+            if row[name]:
+                by_n[row[name]].append(k)
+        if by_n:
+            updates[name] = F(name) - Case(*(When(condition(ks), then=Value(n)) for n, ks in by_n.items()),
+                                           default=Value(0))
+    return updates
+
+
+def _take_off(stats, days):
+    """Subtract {(scope, key): Counter} and {day: Counter}: one UPDATE of the counter rows,
+    and one INSERT and UPDATE of the days."""
+    stats = {k: counts for k, counts in stats.items() if any(counts.values())}
+    if stats:
+        CirculationStat.objects.filter(_rows(stats)).update(**_minus(stats, COUNTERS, _rows))
+    days = {day: counts for day, counts in days.items() if any(counts.values())}
+    if days:
+        shard = random.randrange(day_shards())
+        DailyCirculation.objects.bulk_create((DailyCirculation(day=day, shard=shard) for day in days),
+                                             ignore_conflicts=True)
+        DailyCirculation.objects.filter(day__in=days, shard=shard).update(
+            **_minus(days, DAY_COUNTERS, lambda ds: Q(day__in=ds)))
+
+
+def remove(request, stream_id):
+    """Take a deleted request (active or archived) off every counter that counts it,
+    the same way rebuild() would count it."""
+    if _keeping.get():
+        return
+    counts = Counter(
+        pending=int(not request.is_approved),
+        borrowed=int(request.is_approved and not request.is_returned),
+        returned=int(request.is_returned),
+        overdue=int(not request.is_returned and getattr(request, "overdue_flagged_at", None) is not None),
+    )
+    keys = {"book_id": request.book_id, "book__stream_id": stream_id, "student_id": request.student_id}
+    stats = {(scope, "" if keys[key] is None else str(keys[key])): counts for scope, key in SCOPE_KEYS}
+    days = defaultdict(Counter)
+    for name, field in DAY_FIELDS:
+        when = getattr(request, field)
+        if when is not None:
+            days[timezone.localdate(when)][name] += 1
+    _take_off(stats, days)
+
+
+def forget(**filters):
+    """Take every request matching `filters`, in both tables, off the counters with a few
+    grouped queries, e.g. forget(book_id=1) before a book and its requests are deleted."""
+    if not _keeping.get():
+        _take_off(*_count(**filters))
+
+
+def counters(scope, key):
+    row = CirculationStat.objects.filter(scope=scope, key=str(key)).values(*COUNTERS).first()
+    return row or dict.fromkeys(COUNTERS, 0)
+
+
+def by_stream():
+    names = dict(Stream.objects.values_list("id", "name"))
+    streams = []
+    for row in CirculationStat.objects.filter(scope=CirculationStat.STREAM).values("key", *COUNTERS).order_by("key"):
+        key = row.pop("key")
+        stream_id = int(key) if key else None
+        streams.append({"stream": stream_id, "name": names.get(stream_id), **row})
+    return streams
+
+
+def totals(streams):
+    return {name: sum(row[name] for row in streams) for name in COUNTERS}
+
+
+def daily(days):
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = (
+        DailyCirculation.objects.filter(day__gte=since).values("day")
+        .annotate(**{name: Sum(name) for name in DAY_COUNTERS}).order_by("day")
+    )
+    return list(rows)
+
+
+# ----------------------------
+# Rebuild
+# ----------------------------
+
+def _loan_counts(model, key, filters):
+    annotations = {
+        "pending": Count("id", filter=Q(is_approved=False)),
+        "borrowed": Count("id", filter=Q(is_approved=True, is_returned=False)),
+        "returned": Count("id", filter=Q(is_returned=True)),
+    }
+    if model is BookRequest:
+        annotations["overdue"] = Count("id", filter=Q(is_returned=False, overdue_flagged_at__isnull=False))
+    return model.objects.filter(**filters).values(k=F(key)).annotate(**annotations).order_by()
+
+
+def _day_counts(model, field, filters):
+    return (
+        model.objects.filter(**filters, **{f"{field}__isnull": False}).values(d=TruncDate(field))
+        .annotate(n=Count("id")).order_by().values_list("d", "n")
+    )
+
+
+def _count(**filters):
+    """Count the requests matching `filters` in both tables: ({(scope, key): Counter}, {day: Counter})."""
+    stats = defaultdict(Counter)
+    for scope, key in SCOPE_KEYS:
+        for model in (BookRequest, BookRequestArchive):
+            for row in _loan_counts(model, key, filters):
+                k = row.pop("k")
+                stats[(scope, "" if k is None else str(k))].update(row)
+
+    days = defaultdict(Counter)
+    for name, field in DAY_FIELDS:
+        for model in (BookRequest, BookRequestArchive):
+            for day, n in _day_counts(model, field, filters):
+                days[day][name] += n
+    return stats, days
+
+
+def rebuild():
+    """Recompute every counter from the requests and the archive. Returns (stat rows, days)."""
+    stats, days = _count()
+    with transaction.atomic():
+        CirculationStat.objects.all().delete()
+        CirculationStat.objects.bulk_create(
+            (CirculationStat(scope=scope, key=key, **{name: counts[name] for name in COUNTERS})
+             for (scope, key), counts in stats.items()),
+            batch_size=1000,
+        )
+        DailyCirculation.objects.all().delete()
+        DailyCirculation.objects.bulk_create(
+            (DailyCirculation(day=day, **{name: counts[name] for name in DAY_COUNTERS}) for day, counts in days.items()),
+            batch_size=1000,
+        )
+    return len(stats), len(days)
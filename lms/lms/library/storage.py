@@ -0,0 +1,136 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# ----------------------------
+# Content-addressed storage for Book.pdf
+# ----------------------------
+# A saved file is named after the SHA-256 of its bytes
+# (books/pdfs/ab/ab12...ef.pdf), so the same PDF attached to several books
+# is stored once. PDFBlob keeps a reference count per file, maintained by the
+# Book signals; when it drops to zero the file is deleted after commit.
+# Thumbnails (books/thumbs/, named after the PDF's hash and shared the same
+# way) are counted in PDFBlob too, by library/pdf_processing.py.
+# The PDFBlob row is also the file's lock: a save takes it before trusting
+# that the file exists and Book.save holds it until the reference is
+# committed, while `collect` deletes the file only under it.
+
+HASHED_NAME_RE = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$")
+READ_BLOCK = 1024 * 1024
+
+
+def is_hashed(name):
+    return bool(name and HASHED_NAME_RE.search(name))
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks(READ_BLOCK):
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    directory = posixpath.dirname(name)
+    # keep the upload_to directory, drop the original file name
+    if is_hashed(name):
+        directory = posixpath.dirname(directory)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        name = hashed_name(name, content_digest(content))
+        with transaction.atomic():
+            lock_blob(name)
+            if self.exists(name):
+                return name  # already stored; nothing to write
+            # write under a private name and rename into place, so a half-written
+            # blob is never visible and two concurrent saves of it can't clash
+            staging = posixpath.join(posixpath.dirname(name), f".{uuid.uuid4().hex}.tmp")
+            staging = super()._save(staging, content)
+            os.replace(self.path(staging), self.path(name))
+        return name
+
+
+def get_pdf_storage():
+    return pdf_storage
+
+
+pdf_storage = ContentAddressedStorage()
+
+
+# ---- reference counting ----
+
+def lock_blob(name):
+    """Lock `name`'s PDFBlob row, creating it without references if it's missing. Call inside a transaction."""
+    from .models import PDFBlob
+
+    while True:
+        # locking reads see the latest rows, whatever the isolation level
+        blob = PDFBlob.objects.select_for_update().filter(name=name).first()
+        if blob is not None:
+            return blob
+        try:
+            with transaction.atomic():
+                return PDFBlob.objects.create(name=name)
+        except IntegrityError:
+            pass  # created meanwhile; lock that row instead
+
+
+def add_reference(name):
+    from .models import PDFBlob
+
+    if not name:
+        return
+    updated = PDFBlob.objects.filter(name=name).update(ref_count=F("ref_count") + 1)
+    if not updated:
+        blob, created = PDFBlob.objects.get_or_create(name=name, defaults={"ref_count": 1})
+        if not created:
+            PDFBlob.objects.filter(name=name).update(ref_count=F("ref_count") + 1)
+
+
+def drop_reference(name):
+    from .models import PDFBlob
+
+    if not name:
+        return
+    PDFBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def counted_field(name):
+    """The Book file field a counted file belongs to: 'thumbnail' or 'pdf'."""
+    from .models import Book
+
+    return "thumbnail" if name.startswith(Book._meta.get_field("thumbnail").upload_to) else "pdf"
+
+
+def collect(name):
+    """Delete `name` if nothing references it any more."""
+    from .models import Book
+
+    field = counted_field(name)
+    with transaction.atomic():
+        blob = lock_blob(name)
+        if blob.ref_count > 0:
+            return False
+        # the count is advisory; never delete a file a book still points at
+        if Book.objects.filter(**{field: name}).exists():
+            return False
+        blob.delete()
+        # still under the lock, so a save of the same bytes waits and then
+        # writes the file again rather than finding it about to disappear
+        Book._meta.get_field(field).storage.delete(name)
+    return True
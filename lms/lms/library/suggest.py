@@ -0,0 +1,218 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .search import SharedGenerationIndex, tokenize
+
+# ----------------------------
+# Typeahead suggestions
+# ----------------------------
+# Prefix index over book titles (from every word start, so "algo" finds
+# "Introduction to Algorithms") and author names. Keys live in one sorted
+# list, so a prefix is a contiguous bisect range, and the ranked top-N of a
+# prefix is memoized like the nodes of a trie: a change only drops the
+# entries for the prefixes of the keys it touched. A per-character node trie
+# would be simpler to describe but costs hundreds of bytes per character in
+# Python.
+#
+# Each worker builds its own index on its first lookup (not in
+# AppConfig.ready, which also runs for migrate and every other command),
+# applies its own Book/Author changes in place, and rebuilds when the shared
+# generation shows another worker changed the catalog.
+
+MAX_KEY_LENGTH = 40
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
+
+
+class SuggestIndex(SharedGenerationIndex):
+    index_name = "suggest"
+
+    def __init__(self, limit=None, max_limit=None, cache_size=None, scan_limit=None):
+        self.limit = limit or getattr(settings, "LIBRARY_SUGGEST_LIMIT", 10)
+        self.max_limit = max(self.limit, max_limit or getattr(settings, "LIBRARY_SUGGEST_MAX_LIMIT", 50))
+        self.cache_size = cache_size or getattr(settings, "LIBRARY_SUGGEST_CACHE_SIZE", 50000)
+        self.scan_limit = scan_limit or getattr(settings, "LIBRARY_SUGGEST_SCAN_LIMIT", 20000)
+        self._bulk = False
+        self._init_index()
+
+    def _reset(self):
+        self._keys = []                    # sorted (key, kind, norm)
+        self._books = defaultdict(set)     # (kind, norm) -> {book_id}
+        self._display = {}                 # (kind, norm) -> text as entered
+        self._book_title = {}              # book_id -> (norm, display)
+        self._book_author = {}             # book_id -> author_id
+        self._author_books = defaultdict(set)
+        self._author_name = {}             # author_id -> (norm, display)
+        self._top = {}                     # prefix -> ranked completions (memo)
+
+    # ---- building ----
+
+    def _load(self):
+        from .models import Book
+
+        self._bulk = True  # append keys unsorted, sort once at the end
+        rows = Book.objects.values_list("id", "title", "author_id", "author__name")
+        for book_id, title, author_id, author_name in rows.iterator(chunk_size=2000):
+            self._author_name[author_id] = (normalize(author_name), author_name)
+            self._add_book(book_id, title, author_id)
+        self._bulk = False
+        self._keys.sort()
+
+    @staticmethod
+    def _keys_for(kind, norm):
+        if kind == "author":
+            return {norm[:MAX_KEY_LENGTH]}
+        words = norm.split(" ")
+        return {" ".join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words))}
+
+    def _forget_prefixes(self, key):
+        if self._top:
+            for n in range(1, len(key) + 1):
+                self._top.pop(key[:n], None)
+
+    def _link(self, kind, norm, display, book_id):
+        if not norm:
+            return
+        identity = (kind, norm)
+        is_new = identity not in self._books
+        self._books[identity].add(book_id)
+        self._display.setdefault(identity, display)
+        for key in self._keys_for(kind, norm):
+            if is_new:
+                if self._bulk:
+                    self._keys.append((key, kind, norm))
+                else:
+                    bisect.insort(self._keys, (key, kind, norm))
+            self._forget_prefixes(key)  # its ranking changed either way
+
+    def _unlink(self, kind, norm, book_id):
+        identity = (kind, norm)
+        ids = self._books.get(identity)
+        if not ids:
+            return
+        ids.discard(book_id)
+        gone = not ids
+        if gone:
+            del self._books[identity]
+            self._display.pop(identity, None)
+        for key in self._keys_for(kind, norm):
+            if gone:
+                i = bisect.bisect_left(self._keys, (key, kind, norm))
+                if i < len(self._keys) and self._keys[i] == (key, kind, norm):
+                    del self._keys[i]
+            self._forget_prefixes(key)
+
+    def _add_book(self, book_id, title, author_id):
+        norm = normalize(title)
+        self._book_title[book_id] = (norm, title)
+        self._book_author[book_id] = author_id
+        self._author_books[author_id].add(book_id)
+        self._link("title", norm, title, book_id)
+        author_norm, author_display = self._author_name.get(author_id, ("", ""))
+        self._link("author", author_norm, author_display, book_id)
+
+    def _remove_book(self, book_id):
+        title = self._book_title.pop(book_id, None)
+        if title:
+            self._unlink("title", title[0], book_id)
+        author_id = self._book_author.pop(book_id, None)
+        if author_id is not None:
+            self._author_books[author_id].discard(book_id)
+            self._unlink("author", self._author_name.get(author_id, ("",))[0], book_id)
+
+    # ---- signal hooks ----
+
+    def index_book(self, book):
+        with self._lock:
+            if self._built:
+                self._remove_book(book.pk)
+                self._author_name[book.author_id] = (normalize(book.author.name), book.author.name)
+                self._add_book(book.pk, book.title, book.author_id)
+            self._changed()
+
+    def remove_book(self, book_id):
+        with self._lock:
+            if self._built:
+                self._remove_book(book_id)
+            self._changed()
+
+    def index_author(self, author):
+        with self._lock:
+            if self._built:
+                book_ids = list(self._author_books.get(author.pk, ()))
+                for book_id in book_ids:
+                    self._unlink("author", self._author_name[author.pk][0], book_id)
+                self._author_name[author.pk] = (normalize(author.name), author.name)
+                for book_id in book_ids:
+                    self._link("author", self._author_name[author.pk][0], author.name, book_id)
+            self._changed()
+
+    def remove_author(self, author_id):
+        with self._lock:
+            if self._built:
+                for book_id in list(self._author_books.pop(author_id, ())):
+                    self._remove_book(book_id)
+                self._author_name.pop(author_id, None)
+            self._changed()
+
+    # ---- lookups ----
+
+    def _rank(self, prefix, scan_limit=None):
+        best = {}
+        i = bisect.bisect_left(self._keys, (prefix,))
+        end = len(self._keys) if scan_limit is None else min(len(self._keys), i + scan_limit)
+        while i < end:
+            key, kind, norm = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            best[(kind, norm)] = len(self._books[(kind, norm)])
+            i += 1
+        # most books first, titles before authors on ties, then alphabetical
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0][0] != "title", item[0][1]))
+        return [identity for identity, _ in ranked[:self.max_limit]]
+
+    def suggest(self, query, limit=None):
+        """The top `limit` completions of `query` (default `self.limit`, at most `self.max_limit`)."""
+        limit = min(max(limit or self.limit, 1), self.max_limit)
+        prefix = normalize(query)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_built()
+            ranked = self._top.get(prefix)
+            if ranked is None:
+                if len(self._top) >= self.cache_size:
+                    self._top.clear()
+                # one-letter prefixes are few and hot, so rank them exactly;
+                # the scan cap only guards pathological longer ranges
+                ranked = self._rank(prefix, None if len(prefix) == 1 else self.scan_limit)
+                self._top[prefix] = ranked
+            results = []
+            for kind, norm in ranked[:limit]:
+                ids = self._books[(kind, norm)]
+                results.append({
+                    "text": self._display[(kind, norm)],
+                    "type": kind,
+                    "book_count": len(ids),
+                    "book_ids": heapq.nsmallest(self.limit, ids),
+                })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_suggest_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SuggestIndex()
+    return _index
@@ -1,3 +1,419 @@
+import datetime
+import math
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import archive, content_search, loans, stats
+from .importers import BookImporter
+from .models import (
+    Author, Book, BookPage, BookRequest, BookTerm, CirculationStat, CustomUser, DailyCirculation, SimilarBook, Stream,
+    StudentProfile,
+)
+
+
+def make_books(n, quantity=1, stream=None):
+    author = Author.objects.create(name="Author")
+    stream = stream or Stream.objects.create(name="Stream")
+    return Book.objects.bulk_create(
+        Book(title=f"Book {i}", author=author, stream=stream, quantity=quantity,
+             publication_date=datetime.date(2020, 1, 1))
+        for i in range(n)
+    )
+
+
+def make_student(username="student"):
+    user = CustomUser.objects.create_user(username=username, is_student=True, is_active=True)
+    return StudentProfile.objects.create(user=user, is_approved=True)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+# ----------------------------
+# Book request creation
+# ----------------------------
+class BookRequestCreateQueryCountTests(TestCase):
+    """A batch of requests costs the same queries whatever its size."""
+
+    # the books, then in a savepoint (2): stats (2) and daily stats (2),
+    # plus the INSERT of the requests
+    QUERIES = 7
+
+    @staticmethod
+    def insert_statements(n):
+        # SQLite caps the parameters of a statement, so Django splits a long
+        # bulk INSERT there; MySQL takes any of these batches in one
+        fields = [f for f in BookRequest._meta.concrete_fields if not f.primary_key and not f.generated]
+        return math.ceil(n / connection.ops.bulk_batch_size(fields, [None] * n))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(100)
+
+    def setUp(self):
+        self.student = make_student()
+        self.client = client_for(self.student.user)
+
+    def assert_batch_queries(self, n):
+        payload = [{"book": book.pk} for book in self.books[:n]]
+        with self.assertNumQueries(self.QUERIES + self.insert_statements(n)):
+            response = self.client.post(reverse("book-request-list-create"), payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(BookRequest.objects.filter(student=self.student).count(), n)
+
+    def test_one_request(self):
+        self.assert_batch_queries(1)
+
+    def test_ten_requests(self):
+        self.assert_batch_queries(10)
+
+    def test_hundred_requests(self):
+        self.assert_batch_queries(100)
+
+
+# ----------------------------
+# Book request indexes and the one-open-request constraint
+# ----------------------------
+class BookRequestIndexTests(TestCase):
+    """The hot book-request queries are served by their indexes."""
+
+    # (what, queryset, index the plan should use, filters a boolean column)
+    QUERY_SHAPES = [
+        ("student's requests, ?ordering=requested_at",
+         lambda: BookRequest.objects.filter(student_id=1).order_by("requested_at", "id"),
+         "bookrequest_student_idx", False),
+        ("student's open request for a book",
+         lambda: BookRequest.objects.filter(student_id=1, open_book__in=[1, 2]),
+         "bookrequest_one_open_per_book", False),
+        ("book's pending requests, oldest first (returned copies)",
+         lambda: BookRequest.objects.filter(book_id=1, is_approved=False, is_returned=False).order_by("requested_at"),
+         "bookrequest_book_state_idx", True),
+        ("pending requests, oldest first (librarian claims)",
+         lambda: BookRequest.objects.filter(is_approved=False, waitlisted=False).order_by("requested_at", "id"),
+         "bookrequest_pending_idx", True),
+        ("overdue loans (?overdue=true, sweep_overdue)",
+         lambda: BookRequest.objects.filter(loans.overdue(timezone.now())),
+         "bookrequest_overdue_idx", True),
+    ]
+
+    def test_query_plans_use_indexes(self):
+        for label, queryset, index, boolean in self.QUERY_SHAPES:
+            with self.subTest(label):
+                names = [index]
+                if connection.vendor == "sqlite":
+                    if boolean:
+                        # Django writes `flag = false` as `NOT flag` here, which SQLite can't match to an index
+                        continue
+                    # SQLite builds a UNIQUE constraint into the table under its own name
+                    names.append(f"sqlite_autoindex_{BookRequest._meta.db_table}")
+                plan = queryset().explain()
+                self.assertTrue(any(name in plan for name in names), f"expected {index}:\n{plan}")
+
+
+class OpenRequestConstraintTests(TestCase):
+    """A student has at most one open request per book."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = make_books(2)
+        cls.student = make_student()
+
+    def setUp(self):
+        self.client = client_for(self.student.user)
+
+    def post(self, *books):
+        return self.client.post(reverse("book-request-list-create"), [{"book": book.pk} for book in books],
+                                format="json")
+
+    def test_database_rejects_a_second_open_request(self):
+        BookRequest.objects.create(student=self.student, book=self.book)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BookRequest.objects.create(student=self.student, book=self.book)
+
+    def test_returned_requests_dont_count(self):
+        BookRequest.objects.create(student=self.student, book=self.book, is_approved=True, is_returned=True)
+        BookRequest.objects.create(student=self.student, book=self.book, is_approved=True, is_returned=True)
+        BookRequest.objects.create(student=self.student, book=self.book)
+
+    def test_second_open_request_is_a_400(self):
+        self.assertEqual(self.post(self.book).status_code, 201)
+        response = self.post(self.other, self.book)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["data"], [f"Pending request exists for '{self.book.title}'"])
+        self.assertEqual(BookRequest.objects.filter(student=self.student).count(), 1)
+
+    def test_borrowed_book_is_a_400(self):
+        BookRequest.objects.create(student=self.student, book=self.book, is_approved=True)
+        response = self.post(self.book)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["data"], [f"Already borrowed '{self.book.title}' (not returned yet)"])
+
+    def test_book_listed_twice_is_a_400(self):
+        response = self.post(self.book, self.book)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["data"], [f"'{self.book.title}' is requested more than once"])
+
+
+# ----------------------------
+# Returned copies
+# ----------------------------
+class ReturnedCopyTests(TestCase):
+    """Returned or added copies go to the waitlist, in turn with ordinary pending requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        (cls.book,) = make_books(1, quantity=0)
+        cls.borrower, cls.early, cls.late = (make_student(name) for name in ("borrower", "early", "late"))
+
+    def request(self, student, **fields):
+        return BookRequest.objects.create(student=student, book=self.book, **fields)
+
+    def return_loan(self):
+        loan = self.request(self.borrower, is_approved=True, approved_at=timezone.now())
+        self.assertTrue(loans.bulk_return([loan.pk])[0]["success"])
+
+    def assert_state(self, request, approved, claimed_by=None):
+        request.refresh_from_db()
+        self.assertEqual((request.is_approved, request.claimed_by), (approved, claimed_by))
+
+    def assert_quantity(self, quantity):
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, quantity)
+
+    def test_waitlisted_request_gets_the_copy(self):
+        waiting = self.request(self.late, waitlisted=True)
+        self.return_loan()
+        self.assert_state(waiting, True)
+        self.assert_quantity(0)
+
+    def test_older_ordinary_request_keeps_the_copy_on_the_shelf(self):
+        # made while a copy was still on the shelf, so not waitlisted; it
+        # waits for a librarian, who has claimed it
+        librarian = CustomUser.objects.create_user(username="librarian", is_staff=True, is_active=True)
+        early = self.request(self.early, claimed_by=librarian,
+                             claim_expires_at=timezone.now() + datetime.timedelta(minutes=5))
+        late = self.request(self.late, waitlisted=True)
+        self.return_loan()
+        self.assert_state(early, False, claimed_by=librarian)
+        self.assert_state(late, False)
+        self.assert_quantity(1)
+
+    def test_raised_stock_serves_the_waitlist(self):
+        waiting = [self.request(student, waitlisted=True) for student in (self.early, self.late)]
+        self.book.quantity = 3
+        self.book.save()
+        self.assertEqual(self.book.quantity, 1)
+        for request in waiting:
+            self.assert_state(request, True)
+        self.assert_quantity(1)
+
+    def test_imported_stock_serves_the_waitlist(self):
+        waiting = self.request(self.late, waitlisted=True)
+        BookImporter().run([{"title": self.book.title, "author": "Author", "stream": "Stream",
+                             "publication_date": "2020-01-01", "quantity": "2"}])
+        self.assert_state(waiting, True)
+        self.assert_quantity(1)
+
+    def test_copy_goes_on_the_shelf_without_pending_requests(self):
+        self.return_loan()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 1)
+
+
+# ----------------------------
+# Librarian claims
+# ----------------------------
+class BulkApproveClaimTests(TestCase):
+    """Bulk approval respects other librarians' claims, like single approval."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = make_books(3)
+        cls.student = make_student()
+        cls.librarian, cls.other = (
+            CustomUser.objects.create_user(username=name, is_staff=True, is_active=True)
+            for name in ("librarian", "other")
+        )
+
+    def setUp(self):
+        self.client = client_for(self.librarian)
+
+    def request(self, book, claimed_by=None, expires_in=datetime.timedelta(minutes=5)):
+        return BookRequest.objects.create(student=self.student, book=book, claimed_by=claimed_by,
+                                          claim_expires_at=claimed_by and timezone.now() + expires_in)
+
+    def test_claims(self):
+        mine = self.request(self.books[0], claimed_by=self.librarian)
+        theirs = self.request(self.books[1], claimed_by=self.other)
+        expired = self.request(self.books[2], claimed_by=self.other, expires_in=-datetime.timedelta(minutes=1))
+        response = self.client.post(reverse("book-request-bulk-approve"),
+                                    {"ids": [mine.pk, theirs.pk, expired.pk]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"], [
+            {"id": mine.pk, "success": True, "message": "OK"},
+            {"id": theirs.pk, "success": False, "message": "Another librarian has claimed this request."},
+            {"id": expired.pk, "success": True, "message": "OK"},
+        ])
+        theirs.refresh_from_db()
+        self.assertFalse(theirs.is_approved)
+        self.assertEqual(theirs.claimed_by, self.other)
+
+
+# ----------------------------
+# Circulation statistics
+# ----------------------------
+class DeleteStatsTests(TestCase):
+    """Deleting requests, books or students leaves the counters as rebuild_stats would."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = make_books(2, quantity=5)
+        cls.student, cls.classmate = make_student("student"), make_student("classmate")
+
+    def setUp(self):
+        client_for(self.student.user).post(reverse("book-request-list-create"),
+                                           [{"book": self.book.pk}, {"book": self.other.pk}], format="json")
+        client_for(self.classmate.user).post(reverse("book-request-list-create"),
+                                             [{"book": self.book.pk}, {"book": self.other.pk}], format="json")
+        mine = BookRequest.objects.filter(student=self.student).order_by("id")
+        loans.bulk_approve([r.pk for r in mine] + [BookRequest.objects.get(student=self.classmate, book=self.book).pk])
+        loans.bulk_return([mine[0].pk])
+
+    @staticmethod
+    def snapshot():
+        counters = {
+            (row.pop("scope"), row.pop("key")): row
+            for row in CirculationStat.objects.values("scope", "key", *stats.COUNTERS)
+            if any(row[name] for name in stats.COUNTERS)
+        }
+        days = {
+            row.pop("day"): row for row in DailyCirculation.objects.values("day").annotate(
+                **{name: Sum(name) for name in stats.DAY_COUNTERS}).order_by()
+            if any(row[name] for name in stats.DAY_COUNTERS)
+        }
+        return counters, days
+
+    def assert_rebuilt_matches(self):
+        kept = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(kept, self.snapshot())
+
+    def test_delete_request(self):
+        BookRequest.objects.filter(student=self.classmate).delete()
+        self.assert_rebuilt_matches()
+
+    def test_delete_book(self):
+        archive.archive_returned(older_than=datetime.timedelta(0))
+        self.book.delete()
+        self.assert_rebuilt_matches()
+        self.assertFalse(CirculationStat.objects.filter(scope=CirculationStat.BOOK, key=str(self.book.pk)).exists())
+
+    def test_delete_student(self):
+        self.student.user.delete()
+        self.assert_rebuilt_matches()
+
+    def test_archiving_keeps_counts(self):
+        before = self.snapshot()
+        self.assertEqual(archive.archive_returned(older_than=datetime.timedelta(0)), 1)
+        self.assertEqual(before, self.snapshot())
+        self.assert_rebuilt_matches()
+
+
+# ----------------------------
+# PDF content search
+# ----------------------------
+class ContentSearchFoldingTests(TestCase):
+    """Terms differing only in case or accents are one term."""
+
+    @classmethod
+    def setUpTestData(cls):
+        (cls.book,) = make_books(1)
+        Book.objects.filter(pk=cls.book.pk).update(pdf_status=Book.PDF_READY)
+        pages = [(1, "Un café au Café de Flore."), (2, "Another cafe.")]
+        BookPage.objects.bulk_create(BookPage(book=cls.book, number=number, text=text) for number, text in pages)
+        content_search.index_book(cls.book.pk, pages)
+
+    def test_one_row_per_folded_term(self):
+        self.assertEqual(list(BookTerm.objects.filter(book=self.book, term__startswith="caf").values_list("term", "tf")),
+                         [("cafe", 3)])
+
+    def test_limit_is_clamped(self):
+        client = client_for(make_student().user)
+        for limit in ("-3", "0", "abc", "500"):
+            with self.subTest(limit):
+                response = client.get(reverse("book-content-search"), {"q": "cafe", "limit": limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["data"]), 1)
+
+    def test_either_spelling_finds_the_accented_text(self):
+        for query in ("cafe", "CAFÉ"):
+            with self.subTest(query):
+                (result,) = content_search.search(query)
+                self.assertEqual(result["book"], self.book.pk)
+                self.assertIn("café", result["matches"][0]["snippet"])
+
+
+class DeleteStatsQueryCountTests(TestCase):
+    """Archiving and cascading deletes cost the same queries however many requests they carry."""
+
+    def queries(self, n, action):
+        stream = Stream.objects.create(name=f"Stream {n}")
+        (book,) = make_books(1, stream=stream)
+        students = [make_student(f"student-{n}-{i}") for i in range(n)]
+        returned = timezone.now() - datetime.timedelta(days=1)
+        BookRequest.objects.bulk_create(
+            BookRequest(student=student, book=book, is_approved=True, approved_at=returned,
+                        is_returned=True, returned_at=returned)
+            for student in students
+        )
+        with CaptureQueriesContext(connection) as queries:
+            action(book)
+        return len(queries)
+
+    def assert_constant(self, action):
+        self.assertEqual(self.queries(2, action), self.queries(20, action))
+
+    def test_archive(self):
+        self.assert_constant(lambda book: archive.archive_returned(older_than=datetime.timedelta(0)))
+
+    def test_delete_book(self):
+        self.assert_constant(lambda book: book.delete())
+
+    def test_delete_archived_book(self):
+        def action(book):
+            archive.archive_returned(older_than=datetime.timedelta(0))
+            book.delete()
+        self.assert_constant(action)
+
+
+# ----------------------------
+# Similar books
+# ----------------------------
+class BookSimilarLimitTests(TestCase):
+    """?limit= is clamped to 1..top_k, and ignored when it isn't a number."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, *cls.others = make_books(4)
+        SimilarBook.objects.bulk_create(
+            SimilarBook(book=cls.book, similar=other, rank=rank, score=1 / rank)
+            for rank, other in enumerate(cls.others, 1)
+        )
 
-# Create your tests here.
+    def test_limits(self):
+        client = client_for(make_student().user)
+        for limit, expected in (("-3", 1), ("0", 1), ("2", 2), ("500", 3), ("abc", 3), ("", 3)):
+            with self.subTest(limit):
+                response = client.get(reverse("book-similar", args=[self.book.pk]), {"limit": limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([row["similar_id"] for row in response.data["data"]],
+                                 [other.pk for other in self.others[:expected]])
@@ -0,0 +1,182 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Book, PDFUpload
+
+# ----------------------------
+# Resumable chunked PDF uploads
+# ----------------------------
+# init -> PATCH chunks at `Upload-Offset` -> finalize. Each chunk is copied
+# from the request stream straight into `<MEDIA_ROOT>/<LIBRARY_UPLOAD_TEMP_DIR>/<id>.part`,
+# so nothing goes through Django's upload handlers. `received` is only moved
+# forward once a chunk is fully on disk (a conditional UPDATE, so no row
+# lock is held while a chunk streams in), and chunks are written at their
+# offset rather than appended, so re-sending a chunk after a dropped
+# connection is harmless and the client resumes from `received`.
+# Finalize checks the size and SHA-256, then moves the part file into place
+# (a rename on the same filesystem, or nothing if the same PDF is already
+# stored) and points Book.pdf at it.
+
+COPY_BUFFER = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_size():
+    return getattr(settings, "LIBRARY_UPLOAD_MAX_SIZE", 1024 ** 3)
+
+
+def max_chunk_size():
+    return getattr(settings, "LIBRARY_UPLOAD_MAX_CHUNK_SIZE", 16 * 1024 ** 2)
+
+
+def part_path(upload):
+    directory = os.path.join(settings.MEDIA_ROOT, getattr(settings, "LIBRARY_UPLOAD_TEMP_DIR", "uploads/partial"))
+    return os.path.join(directory, f"{upload.pk}.part")
+
+
+class PartFile(File):
+    """A finished part file; `temporary_file_path` lets FileSystemStorage move it instead of copying."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def start_upload(book, user, filename, size, sha256):
+    filename = os.path.basename(str(filename or "").strip())
+    sha256 = str(sha256 or "").strip().lower()
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("'size' must be an integer.")
+    if not filename.lower().endswith(".pdf"):
+        raise UploadError("'filename' must be a .pdf file.")
+    if not 0 < size <= max_size():
+        raise UploadError(f"'size' must be between 1 and {max_size()} bytes.")
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise UploadError("'sha256' must be a hex SHA-256 digest.")
+
+    upload = PDFUpload.objects.create(book=book, created_by=user, filename=filename, size=size, sha256=sha256)
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    return upload
+
+
+def write_chunk(upload_id, offset, stream, length):
+    try:
+        offset, length = int(offset), int(length)
+    except (TypeError, ValueError):
+        raise UploadError("Send the chunk's position in the 'Upload-Offset' header.")
+    if length <= 0:
+        raise UploadError("Empty chunk.")
+    if length > max_chunk_size():
+        raise UploadError(f"Chunks can be at most {max_chunk_size()} bytes.", status=413)
+
+    # check the offset against the row, but hold neither its lock nor a
+    # transaction while the chunk streams in: a slow client would pin a
+    # database connection for minutes
+    upload = PDFUpload.objects.get(pk=upload_id)
+    check_offset(upload, offset, length)
+    try:
+        part = open(part_path(upload), "r+b")
+    except FileNotFoundError:  # aborted meanwhile
+        raise PDFUpload.DoesNotExist
+    with part:
+        part.seek(offset)
+        remaining = length
+        while remaining:
+            try:
+                data = stream.read(min(COPY_BUFFER, remaining))
+            except OSError:  # client went away mid-chunk
+                data = b""
+            if not data:
+                raise UploadError("Chunk ended early; resend it from the same offset.")
+            part.write(data)
+            remaining -= len(data)
+
+    # of two clients racing on one offset (a resent chunk), only the first
+    # moves `received` on; both wrote the same bytes to the same place
+    moved = PDFUpload.objects.filter(pk=upload_id, received=offset, is_complete=False).update(
+        received=offset + length, updated_at=timezone.now()
+    )
+    if not moved:
+        check_offset(PDFUpload.objects.get(pk=upload_id), offset, length)
+        raise UploadError("Chunk raced another write of the same offset; check the upload's status.", status=409)
+    upload.received = offset + length
+    return upload
+
+
+def check_offset(upload, offset, length):
+    if upload.is_complete:
+        raise UploadError("Upload already finalized.", status=409)
+    if offset != upload.received:
+        raise UploadError(f"Expected offset {upload.received}.", status=409)
+    if offset + length > upload.size:
+        raise UploadError("Chunk runs past the declared size.")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload_id, user):
+    with transaction.atomic():
+        upload = PDFUpload.objects.select_for_update().get(pk=upload_id)
+        if upload.is_complete:
+            raise UploadError("Upload already finalized.", status=409)
+        if upload.received != upload.size:
+            raise UploadError(f"Only {upload.received} of {upload.size} bytes received.", status=409)
+
+        path = part_path(upload)
+        with open(path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                raise UploadError("File is not a PDF.")
+        if file_sha256(path) != upload.sha256:
+            # the bytes on disk are wrong somewhere; make the client start over
+            open(path, "wb").close()
+            upload.received = 0
+            upload.save(update_fields=["received", "updated_at"])
+            book = None
+        else:
+            book = Book.objects.select_for_update().get(pk=upload.book_id)
+            with open(path, "rb") as f:
+                book.pdf.save(upload.filename, PartFile(f), save=False)
+            if os.path.exists(path):
+                os.remove(path)  # the same PDF was already stored, so it wasn't moved
+            book.updated_by = user
+            book.save(update_fields=["pdf", "updated_by", "updated_at"])
+            upload.is_complete = True
+            upload.save(update_fields=["is_complete", "updated_at"])
+
+    if book is None:
+        raise UploadError("Checksum mismatch; upload restarted from offset 0.", status=422)
+    return upload, book
+
+
+def abort_upload(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def stale_uploads(max_age_hours=None):
+    max_age_hours = max_age_hours or getattr(settings, "LIBRARY_UPLOAD_EXPIRY_HOURS", 24)
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    return PDFUpload.objects.filter(updated_at__lt=cutoff)
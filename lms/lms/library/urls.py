@@ -7,6 +7,9 @@ from .views import (
     BookDetailAPIView,
     BookRequestListCreateAPIView,
     ApproveBookRequestAPIView,
+    BookRequestClaimAPIView,
+    BulkApproveBookRequestsAPIView,
+    BulkReturnBookRequestsAPIView,
     StudentProfileAPIView,
     AdminStudentListAPIView,
     AdminApproveStudentAPIView,
@@ -15,7 +18,19 @@ from .views import (
     StudentProfileUpdateAPIView,
     ReturnBookAPIView,
     ChangePasswordView,
-    StreamListAPIView
+    StreamListAPIView,
+    CatalogCacheStatsAPIView,
+    BookImportAPIView,
+    BookExportAPIView,
+    BookRequestExportAPIView,
+    BookSuggestAPIView,
+    BookContentSearchAPIView,
+    BookPDFDownloadAPIView,
+    PDFUploadStartAPIView,
+    PDFUploadAPIView,
+    PDFUploadFinalizeAPIView,
+    CirculationStatsAPIView,
+    BookSimilarAPIView
 )
 
 urlpatterns = [
@@ -28,11 +43,25 @@ urlpatterns = [
     # Book endpoints
     path('books/', BookListCreateAPIView.as_view(), name='book-list-create'),
     path('books/<int:pk>/', BookDetailAPIView.as_view(), name='book-detail'),
+    path('books/<int:pk>/similar/', BookSimilarAPIView.as_view(), name='book-similar'),
+    path('books/<int:pk>/pdf/', BookPDFDownloadAPIView.as_view(), name='book-pdf'),
+    path('books/<int:pk>/pdf/uploads/', PDFUploadStartAPIView.as_view(), name='book-pdf-upload-start'),
+    path('pdf-uploads/<uuid:upload_id>/', PDFUploadAPIView.as_view(), name='pdf-upload'),
+    path('pdf-uploads/<uuid:upload_id>/finalize/', PDFUploadFinalizeAPIView.as_view(), name='pdf-upload-finalize'),
+    path('books/cache-stats/', CatalogCacheStatsAPIView.as_view(), name='book-cache-stats'),
+    path('books/import/', BookImportAPIView.as_view(), name='book-import'),
+    path('books/export/', BookExportAPIView.as_view(), name='book-export'),
+    path('books/suggest/', BookSuggestAPIView.as_view(), name='book-suggest'),
+    path('books/content-search/', BookContentSearchAPIView.as_view(), name='book-content-search'),
     path('streams/', StreamListAPIView.as_view(), name='stream-list'),
 
 
     # Book request endpoints
     path('book-requests/', BookRequestListCreateAPIView.as_view(), name='book-request-list-create'),
+    path('book-requests/export/', BookRequestExportAPIView.as_view(), name='book-request-export'),
+    path('book-requests/claim/', BookRequestClaimAPIView.as_view(), name='book-request-claim'),
+    path('book-requests/bulk-approve/', BulkApproveBookRequestsAPIView.as_view(), name='book-request-bulk-approve'),
+    path('book-requests/bulk-return/', BulkReturnBookRequestsAPIView.as_view(), name='book-request-bulk-return'),
     path('book-requests/<int:pk>/approve/', ApproveBookRequestAPIView.as_view(), name='book-request-approve'),
 
     # Student profile
@@ -56,4 +85,7 @@ urlpatterns = [
     #return book
     path('book-requests/<int:pk>/return/', ReturnBookAPIView.as_view(), name='book-return'),
 
+    # Circulation stats (dashboards)
+    path('stats/', CirculationStatsAPIView.as_view(), name='stats'),
+
 ]
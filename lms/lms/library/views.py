@@ -4,19 +4,33 @@ from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework import status
 from django.utils import timezone
 from django.utils.timezone import localtime, make_aware
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from datetime import datetime
-from django.db.models import Q
-from .models import Book, StudentProfile, BookRequest, Stream, CustomUser as User
+import itertools
+from .models import Book, StudentProfile, BookRequest, BookRequestArchive, CirculationStat, SimilarBook, Stream, PDFUpload, CustomUser as User
 from .serializers import (
     RegisterSerializer,
     BookSerializer,
     StudentProfileSerializer,
-    BookRequestSerializer
+    BookRequestSerializer,
+    BookValuesListSerializer,
+    BookRequestValuesListSerializer,
+    datetime_formatter
 )
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from django.db.models import F
+from .facets import book_facets
+from .exports import export_response, CONTENT_TYPES
+from .importers import BookImporter, ImportFormatError, iter_records, guess_format
+from .search import get_search_backend
+from .suggest import get_suggest_index
+from . import catalog_cache, content_search, loans, recommendations, stats
+from .conditional import conditional_get
+from .downloads import serve_file, unsign_download
+from .uploads import UploadError, start_upload, write_chunk, finalize_upload, abort_upload
+from .pagination import KeysetPaginator, InvalidCursor, BOOK_ORDERINGS, BOOK_REQUEST_ORDERINGS
 # ----------------------------
 # Registration View
 # ----------------------------
@@ -96,6 +110,7 @@ from .serializers import StreamSerializer
 class StreamListAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(lambda request: Stream.objects.all(), timestamps=['updated_at'])
     def get(self, request):
         streams = Stream.objects.all()
         serializer = StreamSerializer(streams, many=True)
@@ -106,31 +121,70 @@ class StreamListAPIView(APIView):
         })
     
 
-class BookListCreateAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+def filter_books(request):
+    search_query = request.query_params.get('search', '').strip()
+    stream_id = request.query_params.get('stream', '').strip()
 
-    def get(self, request):
-        search_query = request.query_params.get('search', '').strip()
-        stream_id = request.query_params.get('stream', '').strip()
+    books = Book.objects.all()
+
+    # Filter by stream only if provided and not 'all'
+    if stream_id and stream_id.lower() != "all":
+        books = books.filter(stream_id=stream_id)
+
+    # Search by title or author name (indexed, ranked by relevance)
+    if search_query:
+        books = get_search_backend().search(books, search_query)
+    return books
 
-        books = Book.objects.all()
 
-        # Search by title or author name
-        if search_query:
-            books = books.filter(
-                Q(title__icontains=search_query) |
-                Q(author__name__icontains=search_query)
-            )
+# what a serialized book shows: its own row, its author's and its stream's names
+BOOK_TIMESTAMPS = ['updated_at', 'author__updated_at', 'stream__updated_at']
 
-        # Filter by stream only if provided and not 'all'
-        if stream_id and stream_id.lower() != "all":
-            books = books.filter(stream_id=stream_id)
 
-        serializer = BookSerializer(books, many=True)
+class BookListCreateAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @conditional_get(filter_books, timestamps=BOOK_TIMESTAMPS, counts=['stream'],
+                     cache_key=catalog_cache.book_list_key)
+    def get(self, request):
+        key = catalog_cache.book_list_key(request)
+        payload = catalog_cache.lookup(key)
+        if payload is not None:
+            return Response(payload)
+
+        response = self.list_books(request)
+        if response.status_code == 200:
+            catalog_cache.store(key, response.data)
+        return response
+
+    def list_books(self, request):
+        books = filter_books(request)
+        extra = {}
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            extra["facets"] = book_facets(books)
+
+        # Opt-in keyset pagination (?page_size= / ?cursor=); ordered by key, not relevance
+        if KeysetPaginator.is_requested(request):
+            try:
+                page = KeysetPaginator(BOOK_ORDERINGS).paginate(BookValuesListSerializer.values(books), request)
+            except InvalidCursor as exc:
+                return Response({"success": False, "message": str(exc), "data": []}, status=400)
+            serializer = BookValuesListSerializer(page.rows)
+            return Response({
+                "success": True,
+                "message": "Books fetched successfully.",
+                "data": serializer.data,
+                "next": page.next,
+                "prev": page.prev,
+                **extra
+            })
+
+        serializer = BookValuesListSerializer(books)
         return Response({
             "success": True,
             "message": "Books fetched successfully.",
-            "data": serializer.data
+            "data": serializer.data,
+            **extra
         })
 
 
@@ -144,7 +198,7 @@ class BookListCreateAPIView(APIView):
                 "message": "Book created successfully.",
                 "data": serializer.data
             }, status=201)
-        except:
+        except IntegrityError:
             return Response({
                 "success": False,
                 "message": "Book already exists.",
@@ -158,6 +212,7 @@ class BookDetailAPIView(APIView):
     def get_object(self, pk):
         return Book.objects.get(pk=pk)
 
+    @conditional_get(lambda request, pk: Book.objects.filter(pk=pk), timestamps=BOOK_TIMESTAMPS, counts=['stream'])
     def get(self, request, pk):
         book = self.get_object(pk)
         serializer = BookSerializer(book)
@@ -175,19 +230,294 @@ class BookDetailAPIView(APIView):
         book.delete()
         return Response({"success": True, "message": "Book deleted.", "data": []})
 
+class BookPDFDownloadAPIView(APIView):
+    # the browser opens pdf_url directly, so a signed `?sig=` link stands in
+    # for the JWT header; access is re-checked against the loan either way
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        if request.user.is_authenticated:
+            user_id, is_staff = request.user.pk, request.user.is_staff
+        else:
+            user_id = unsign_download(request.query_params.get('sig', ''), pk)
+            is_staff = False
+            if user_id is None:
+                return Response({"success": False, "message": "Invalid or expired download link.", "data": []}, status=401)
+
+        book = Book.objects.filter(pk=pk).only('id', 'title', 'pdf').first()
+        if book is None or not book.pdf:
+            return Response({"success": False, "message": "Book PDF not found.", "data": []}, status=404)
+
+        has_loan = BookRequest.objects.filter(
+            book_id=pk, student__user_id=user_id, is_approved=True, is_returned=False
+        ).exists()
+        if not (is_staff or has_loan):
+            return Response({"success": False, "message": "You don't have this book on loan.", "data": []}, status=403)
+
+        try:
+            return serve_file(request, book.pdf, download_name=f"{book.title}.pdf")
+        except FileNotFoundError:
+            return Response({"success": False, "message": "Book PDF not found.", "data": []}, status=404)
+
+
+def upload_state(upload):
+    return {
+        "id": str(upload.pk),
+        "book": upload.book_id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.received,
+        "is_complete": upload.is_complete,
+    }
+
+
+class PDFUploadStartAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        book = Book.objects.filter(pk=pk).first()
+        if book is None:
+            return Response({"success": False, "message": "Book not found.", "data": []}, status=404)
+        try:
+            upload = start_upload(book, request.user, request.data.get('filename'),
+                                  request.data.get('size'), request.data.get('sha256'))
+        except UploadError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=exc.status)
+        return Response({"success": True, "message": "Upload started.", "data": upload_state(upload)}, status=201)
+
+
+class PDFUploadAPIView(APIView):
+    """Status (GET), next chunk (PATCH, raw body at the `Upload-Offset` header) and abort (DELETE)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, upload_id):
+        upload = PDFUpload.objects.filter(pk=upload_id).first()
+        if upload is None:
+            return Response({"success": False, "message": "Upload not found.", "data": []}, status=404)
+        return Response({"success": True, "message": "Upload status.", "data": upload_state(upload)})
+
+    def patch(self, request, upload_id):
+        try:
+            upload = write_chunk(upload_id, request.headers.get('Upload-Offset'),
+                                 request.stream, request.META.get('CONTENT_LENGTH') or 0)
+        except PDFUpload.DoesNotExist:
+            return Response({"success": False, "message": "Upload not found.", "data": []}, status=404)
+        except UploadError as exc:
+            current = PDFUpload.objects.filter(pk=upload_id).values_list('received', flat=True).first()
+            return Response({"success": False, "message": str(exc), "data": {"offset": current}}, status=exc.status)
+        return Response({"success": True, "message": "Chunk stored.", "data": upload_state(upload)})
+
+    def delete(self, request, upload_id):
+        upload = PDFUpload.objects.filter(pk=upload_id).first()
+        if upload is None:
+            return Response({"success": False, "message": "Upload not found.", "data": []}, status=404)
+        abort_upload(upload)
+        return Response({"success": True, "message": "Upload cancelled.", "data": []})
+
+
+class PDFUploadFinalizeAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, upload_id):
+        try:
+            upload, book = finalize_upload(upload_id, request.user)
+        except PDFUpload.DoesNotExist:
+            return Response({"success": False, "message": "Upload not found.", "data": []}, status=404)
+        except UploadError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=exc.status)
+        return Response({"success": True, "message": "PDF attached to book.", "data": upload_state(upload)})
+
+
+class BookImportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"success": False, "message": "Upload a CSV or NDJSON file as 'file'.", "data": []}, status=400)
+
+        fmt = request.data.get('format') or guess_format(upload.name)
+        try:
+            importer = BookImporter(user=request.user, on_conflict=request.data.get('on_conflict', 'update'))
+        except ImportFormatError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=400)
+        try:
+            report = importer.run(iter_records(upload, fmt))
+        except ImportFormatError as exc:
+            # chunks before the bad line are already imported; say how many
+            return Response({"success": False, "message": str(exc), "data": importer.report}, status=400)
+
+        if not report['rows']:
+            return Response({"success": False, "message": "The file has no book rows.", "data": report}, status=400)
+        return Response({
+            "success": report['failed'] == 0,
+            "message": f"Imported {report['created']} new and {report['updated']} updated book(s); {report['failed']} row(s) failed.",
+            "data": report
+        }, status=400 if report['failed'] == report['rows'] else 200)
+
+
+def query_limit(request, default, maximum):
+    """?limit= clamped to 1..maximum, or `default` when it is missing or not a whole number."""
+    try:
+        limit = int(request.query_params.get('limit', ''))
+    except ValueError:
+        return default
+    return min(max(limit, 1), maximum)
+
+
+class BookSuggestAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        index = get_suggest_index()
+        limit = query_limit(request, index.limit, index.max_limit)
+        return Response({
+            "success": True,
+            "message": "Suggestions fetched.",
+            "data": index.suggest(query, limit=limit)
+        })
+
+
+class BookContentSearchAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"success": False, "message": "Pass the text to look for as ?q=.", "data": []}, status=400)
+        limit = query_limit(request, None, 100)
+        results = content_search.search(query, limit=limit)
+        return Response({"success": True, "message": f"{len(results)} book(s) found.", "data": results})
+
+
+
+class BookSimilarAPIView(APIView):
+    """Books most often borrowed by the same students, precomputed by `manage.py build_recommendations`."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        limit = query_limit(request, None, recommendations.top_k())
+        similar = (
+            SimilarBook.objects.filter(book_id=pk).order_by('rank')
+            .values('similar_id', 'score', title=F('similar__title'), author=F('similar__author__name'))
+        )
+        similar = list(similar[:limit] if limit else similar)
+        return Response({"success": True, "message": f"{len(similar)} similar book(s) found.", "data": similar})
+
+class BookExportAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in CONTENT_TYPES:
+            return Response({"success": False, "message": "type must be 'csv' or 'ndjson'.", "data": []}, status=400)
+        return export_response(BookValuesListSerializer, filter_books(request), fmt, "books")
+
+
+class CatalogCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"success": True, "message": "Catalog cache stats.", "data": catalog_cache.stats()})
+
 # ----------------------------
 # Book Requests
 # ----------------------------
+def parse_moment(value, end_of_day=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date '{value}'. Use YYYY-MM-DD or an ISO datetime.")
+        moment = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = make_aware(moment)
+    return moment
+
+
+def filter_book_requests(request):
+    """Staff see every request, students their own; ?requested_from= / ?requested_to= narrow by date,
+    ?overdue=true|false to loans past / not past their due date.
+
+    Returns a list of querysets: the active requests and, for a student's own
+    history or with ?archived=true, the archived ones (see library/archive.py).
+    """
+    tables = [BookRequest]
+    if not request.user.is_staff or request.query_params.get('archived', '').lower() in ('1', 'true', 'yes'):
+        tables.append(BookRequestArchive)
+    return [filter_requests_in(model, request) for model in tables]
+
+
+def filter_requests_in(model, request):
+    user = request.user
+    if user.is_staff:
+        requests = model.objects.select_related('student', 'book').all()
+    else:
+        requests = model.objects.filter(student__user=user)
+
+    requested_from = request.query_params.get('requested_from', '').strip()
+    requested_to = request.query_params.get('requested_to', '').strip()
+    if requested_from:
+        requests = requests.filter(requested_at__gte=parse_moment(requested_from))
+    if requested_to:
+        requests = requests.filter(requested_at__lte=parse_moment(requested_to, end_of_day=True))
+    overdue = request.query_params.get('overdue', '').strip().lower()
+    if overdue in ('1', 'true', 'yes'):
+        requests = requests.filter(loans.overdue())
+    elif overdue in ('0', 'false', 'no'):
+        requests = requests.exclude(loans.overdue())
+    elif overdue:
+        raise ValueError("overdue must be true or false.")
+    return requests
+
+
+def open_request_errors(student, books):
+    """Why creating requests for `books` clashed with the student's open requests."""
+    open_requests = dict(
+        BookRequest.objects.filter(student=student, open_book__in=[book.pk for book in books])
+        .values_list('book_id', 'is_approved')
+    )
+    errors, seen = [], set()
+    for book in books:
+        if book.pk in seen:
+            errors.append(f"'{book.title}' is requested more than once")
+            continue
+        seen.add(book.pk)
+        if open_requests.get(book.pk) is False:
+            errors.append(f"Pending request exists for '{book.title}'")
+        elif open_requests.get(book.pk):
+            errors.append(f"Already borrowed '{book.title}' (not returned yet)")
+    return errors or ["Could not create the request(s); please try again."]
+
+
 class BookRequestListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        if user.is_staff:
-            requests = BookRequest.objects.select_related('student', 'book').all()
-        else:
-            requests = BookRequest.objects.filter(student__user=user)
-        serializer = BookRequestSerializer(requests, many=True)
+        try:
+            requests = filter_book_requests(request)
+        except ValueError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=400)
+
+        if KeysetPaginator.is_requested(request):
+            try:
+                page = KeysetPaginator(BOOK_REQUEST_ORDERINGS).paginate(
+                    [BookRequestValuesListSerializer.values(qs) for qs in requests], request)
+            except InvalidCursor as exc:
+                return Response({"success": False, "message": str(exc), "data": []}, status=400)
+            serializer = BookRequestValuesListSerializer(page.rows)
+            return Response({
+                "success": True,
+                "message": "Book requests fetched.",
+                "data": serializer.data,
+                "next": page.next,
+                "prev": page.prev
+            })
+
+        rows = itertools.chain.from_iterable(
+            BookRequestValuesListSerializer.values(qs).iterator(chunk_size=2000) for qs in requests)
+        serializer = BookRequestValuesListSerializer(rows)
         return Response({
             "success": True,
             "message": "Book requests fetched.",
@@ -231,72 +561,143 @@ class BookRequestListCreateAPIView(APIView):
             return Response({"success": False, "message": "Student profile not found.", "data": []}, status=404)
 
         data = request.data if isinstance(request.data, list) else [request.data]
-        serializer = BookRequestSerializer(data=data, many=True)
+        # one query for every book in the batch instead of one per item
+        book_ids = set()
+        for item in data:
+            try:
+                book_ids.add(int(item.get('book')))
+            except (AttributeError, TypeError, ValueError):
+                pass  # left for the serializer to reject
+        serializer = BookRequestSerializer(data=data, many=True, context={'books': Book.objects.in_bulk(book_ids)})
         serializer.is_valid(raise_exception=True)
+        books = [item['book'] for item in serializer.validated_data]
 
-        # collect book instances (validated_data gives book instances for PKRelatedField)
-        books = []
-        for item in serializer.validated_data:
-            b = item.get('book')
-            # be defensive: if b is an ID, fetch instance
-            if isinstance(b, Book):
-                books.append(b)
-            else:
-                books.append(Book.objects.get(pk=b))
-
-        errors = []
-        for book in books:
-            # pending (not approved) request exists
-            if BookRequest.objects.filter(student=student, book=book, is_approved=False, is_returned=False).exists():
-                errors.append(f"Pending request exists for '{book.title}'")
-            # already borrowed (approved but not returned)
-            if BookRequest.objects.filter(student=student, book=book, is_approved=True, is_returned=False).exists():
-                errors.append(f"Already borrowed '{book.title}' (not returned yet)")
-            # optional: check stock at request time
-            if book.quantity < 1:
-                errors.append(f"'{book.title}' is currently out of stock")
-
-        if errors:
-            return Response({"success": False, "message": "Validation failed.", "data": errors}, status=status.HTTP_400_BAD_REQUEST)
-
-        # create requests in a single transaction (bulk_create)
-        with transaction.atomic():
-            br_objs = [BookRequest(student=student, book=book) for book in books]
-            BookRequest.objects.bulk_create(br_objs)
+        # one open request per student and book is enforced by the database
+        # (bookrequest_one_open_per_book); only a rejected batch is explained
+        try:
+            with transaction.atomic():
+                # out of stock: queue for the next returned copy
+                br_objs = [BookRequest(student=student, book=book, waitlisted=book.quantity < 1) for book in books]
+                BookRequest.objects.bulk_create(br_objs)
+                stats.add([{'student_id': student.pk, 'book_id': book.pk, 'stream_id': book.stream_id} for book in books],
+                          pending=1)
+                stats.add_daily(requested=len(books))
+        except IntegrityError:
+            return Response({"success": False, "message": "Validation failed.", "data": open_request_errors(student, books)},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         resp_serializer = BookRequestSerializer(br_objs, many=True, context={'request': request})
-        return Response({"success": True, "message": f"{len(br_objs)} request(s) created.", "data": resp_serializer.data}, status=201)
+        message = f"{len(br_objs)} request(s) created."
+        waitlisted = sum(br.waitlisted for br in br_objs)
+        if waitlisted:
+            message += f" {waitlisted} book(s) out of stock; you're on the waitlist for the next copy returned."
+        return Response({"success": True, "message": message, "data": resp_serializer.data}, status=201)
+
+class BookRequestExportAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in CONTENT_TYPES:
+            return Response({"success": False, "message": "type must be 'csv' or 'ndjson'.", "data": []}, status=400)
+        try:
+            requests = filter_book_requests(request)
+        except ValueError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=400)
+        return export_response(BookRequestValuesListSerializer, requests, fmt, "book_requests")
 
 # ----------------------------
 # Approve Book Request (Admin)
 # ----------------------------
-from datetime import timedelta
 class ApproveBookRequestAPIView(APIView):
     permission_classes = [IsAdminUser]
 
     def patch(self, request, pk):
         try:
-            req = BookRequest.objects.select_related('book').get(pk=pk)
-            if req.is_approved:
-                return Response({"success": False, "message": "Already approved.", "data": []}, status=400)
-            if req.book.quantity < 1:
-                return Response({"success": False, "message": "Book not available.", "data": []}, status=400)
+            loans.approve(pk, user=request.user)
+        except BookRequest.DoesNotExist:
+            return Response({"success": False, "message": "Request not found.", "data": []}, status=404)
+        except loans.LoanError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=exc.status)
 
-            req.is_approved = True
-            req.approved_at = timezone.now()
-            req.return_due_date = req.approved_at + timedelta(days=7)
-            req.save()
+        req = BookRequest.objects.select_related('book', 'student').get(pk=pk)
+        return Response({
+            "success": True,
+            "message": "Request approved, return due date set, and book quantity updated.",
+            "data": BookRequestSerializer(req).data
+        })
 
-            req.book.quantity -= 1
-            req.book.save()
 
-            return Response({
-                "success": True,
-                "message": "Request approved, return due date set, and book quantity updated.",
-                "data": BookRequestSerializer(req).data
-            })
-        except BookRequest.DoesNotExist:
-            return Response({"success": False, "message": "Request not found.", "data": []}, status=404)
+# ----------------------------
+# Librarian Work Queue (Admin)
+# ----------------------------
+class BookRequestClaimAPIView(APIView):
+    """POST claims the next pending requests for the librarian (a short lease); DELETE gives claims back."""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        try:
+            limit = int(request.data.get('limit', 10))
+        except (TypeError, ValueError):
+            limit = 0
+        if not 1 <= limit <= loans.claim_max():
+            return Response({"success": False, "message": f"limit must be between 1 and {loans.claim_max()}.", "data": []},
+                            status=400)
+
+        ids, expires = loans.claim(request.user, limit)
+        rows = BookRequestValuesListSerializer.values(BookRequest.objects.filter(pk__in=ids)).order_by('requested_at', 'id')
+        return Response({
+            "success": True,
+            "message": f"{len(ids)} request(s) claimed." if ids else "No pending requests left to claim.",
+            "data": BookRequestValuesListSerializer(list(rows), context={'request': request}).data,
+            "claim_expires_at": datetime_formatter()(expires)
+        })
+
+    def delete(self, request):
+        ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+        try:
+            released = loans.release(request.user, loans.clean_ids(ids) if ids is not None else None)
+        except loans.LoanError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=exc.status)
+        return Response({"success": True, "message": f"{released} claim(s) released.", "data": []})
+
+
+# ----------------------------
+# Bulk Approve / Return Book Requests (Admin)
+# ----------------------------
+class BulkLoanAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    verb = None
+
+    def apply(self, ids, user):
+        raise NotImplementedError
+
+    def post(self, request):
+        ids = request.data.get('ids') if hasattr(request.data, 'get') else request.data
+        try:
+            results = self.apply(ids, request.user)
+        except loans.LoanError as exc:
+            return Response({"success": False, "message": str(exc), "data": []}, status=exc.status)
+        done = sum(r["success"] for r in results)
+        return Response({
+            "success": True,
+            "message": f"{done} of {len(results)} requests {self.verb}.",
+            "data": results
+        })
+
+
+class BulkApproveBookRequestsAPIView(BulkLoanAPIView):
+    verb = "approved"
+
+    def apply(self, ids, user):
+        return loans.bulk_approve(ids, user=user)
+
+
+class BulkReturnBookRequestsAPIView(BulkLoanAPIView):
+    verb = "returned"
+
+    def apply(self, ids, user):
+        return loans.bulk_return(ids)
 
 
 # ----------------------------
@@ -529,8 +930,15 @@ class ReturnBookAPIView(APIView):
                 book_request.was_overdue = was_overdue
                 book_request.save()
 
-                # increment book quantity safely
-                Book.objects.filter(pk=book_request.book.pk).update(quantity=F('quantity') + 1)
+                loan = {'student_id': book_request.student_id, 'book_id': book_request.book_id,
+                        'stream_id': book_request.book.stream_id}
+                # the copy goes to the book's waitlist, or back in stock; the
+                # counters come after the book, as on every loan path
+                loans.restock({book_request.book_id: 1}, {book_request.book_id: loan}, book_request.returned_at)
+                stats.add([loan], borrowed=-1, returned=1)
+                stats.add_daily(returned=1)
+                if book_request.overdue_flagged_at:
+                    loans.unflag([loan])
 
             return Response({
                 "success": True,
@@ -539,4 +947,39 @@ class ReturnBookAPIView(APIView):
             })
 
         except BookRequest.DoesNotExist:
-            return Response({"success": False, "message": "Book request not found.", "data": []}, status=404)
\ No newline at end of file
+            return Response({"success": False, "message": "Book request not found.", "data": []}, status=404)
+
+# ----------------------------
+# Circulation Stats
+# ----------------------------
+class CirculationStatsAPIView(APIView):
+    """Loan counts from the counters in library/stats.py: a student's own, or for staff the whole library
+    (?days= of daily activity, ?book= / ?student= for one book or student)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not request.user.is_staff:
+            try:
+                student_id = request.user.student_profile.pk
+            except StudentProfile.DoesNotExist:
+                return Response({"success": False, "message": "Student profile not found.", "data": []}, status=404)
+            return Response({
+                "success": True,
+                "message": "Stats fetched.",
+                "data": {"student": stats.counters(CirculationStat.STUDENT, student_id)}
+            })
+
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 366:
+            return Response({"success": False, "message": "days must be between 1 and 366.", "data": []}, status=400)
+
+        streams = stats.by_stream()
+        data = {"totals": stats.totals(streams), "streams": streams, "daily": stats.daily(days)}
+        for scope in (CirculationStat.BOOK, CirculationStat.STUDENT):
+            key = request.query_params.get(scope, '').strip()
+            if key:
+                data[scope] = stats.counters(scope, key)
+        return Response({"success": True, "message": "Stats fetched.", "data": data})
@@ -174,4 +174,90 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
-}
\ No newline at end of file
+}
+
+# Catalog search (library/search.py). Leave unset to use MySQL FULLTEXT on
+# MySQL and the in-process inverted index on other databases.
+# LIBRARY_SEARCH_BACKEND = 'library.search.InProcessSearchBackend'
+LIBRARY_SEARCH_MAX_RESULTS = 1000
+
+# Cache used for catalog responses (library/catalog_cache.py). LocMem is
+# per-process: point this at a shared backend (Redis, Memcached) when
+# running several workers so invalidations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+LIBRARY_CATALOG_CACHE = 'default'
+LIBRARY_CATALOG_CACHE_TIMEOUT = 300
+
+# Bulk book import (library/importers.py)
+LIBRARY_IMPORT_CHUNK_SIZE = 1000
+LIBRARY_IMPORT_MAX_ERRORS = 1000
+
+# Streaming exports read rows in keyset batches of this size (library/exports.py)
+LIBRARY_EXPORT_BATCH_SIZE = 2000
+
+# Typeahead suggestions (library/suggest.py)
+LIBRARY_SUGGEST_LIMIT = 10
+LIBRARY_SUGGEST_MAX_LIMIT = 50  # largest ?limit= accepted
+LIBRARY_SUGGEST_CACHE_SIZE = 50000
+
+# Largest number of authors returned in ?facets=true (library/facets.py)
+LIBRARY_FACET_AUTHOR_LIMIT = 50
+
+# Protected PDF downloads (library/downloads.py). Set LIBRARY_PDF_OFFLOAD to
+# 'x-accel-redirect' (nginx, with an `internal` location at
+# LIBRARY_PDF_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache
+# mod_xsendfile) to hand the transfer to the web server; left unset, Django
+# streams the file itself, with Range support.
+LIBRARY_PDF_OFFLOAD = None
+LIBRARY_PDF_ACCEL_PREFIX = '/protected-media/'
+LIBRARY_PDF_LINK_MAX_AGE = 3600
+LIBRARY_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Resumable PDF uploads (library/uploads.py). Part files are written under
+# MEDIA_ROOT so finalizing is a rename; run `manage.py clean_uploads` from
+# cron to drop abandoned sessions.
+LIBRARY_UPLOAD_TEMP_DIR = 'uploads/partial'
+LIBRARY_UPLOAD_MAX_SIZE = 1024 ** 3
+LIBRARY_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 ** 2
+LIBRARY_UPLOAD_EXPIRY_HOURS = 24
+
+# Background PDF processing (library/pdf_processing.py, needs PyMuPDF).
+# At most LIBRARY_PDF_WORKERS PDFs are parsed at once, in separate
+# processes; 0 processes inline right after the commit instead.
+LIBRARY_PDF_WORKERS = 2
+LIBRARY_PDF_THUMBNAIL_WIDTH = 300
+
+# Books returned by /api/books/content-search/ (library/content_search.py)
+LIBRARY_CONTENT_SEARCH_LIMIT = 20
+
+# Loan length set on approval (library/loans.py)
+LIBRARY_LOAN_DAYS = 7
+LIBRARY_BULK_LOAN_MAX = 5000  # ids per bulk approve / return call
+
+# Loans flagged per transaction by `manage.py sweep_overdue` (library/loans.py)
+LIBRARY_OVERDUE_SWEEP_BATCH = 1000
+
+# Librarian work queue (POST /api/book-requests/claim/, library/loans.py)
+LIBRARY_CLAIM_LEASE_SECONDS = 300
+LIBRARY_CLAIM_MAX = 50
+
+# Returned book requests older than this move to BookRequestArchive
+# (`manage.py archive_requests`, library/archive.py)
+LIBRARY_ARCHIVE_AFTER_DAYS = 180
+LIBRARY_ARCHIVE_BATCH = 1000
+
+# Rows each day's counters are spread over, so concurrent loans don't all
+# update one row (library/stats.py)
+LIBRARY_STATS_DAY_SHARDS = 8
+
+# Similar books (`manage.py build_recommendations`, library/recommendations.py):
+# the TOP_K books borrowed by at least MIN_STUDENTS of the same students,
+# counted from loans approved more than LAG_SECONDS ago, BATCH per transaction
+LIBRARY_RECOMMENDATION_TOP_K = 10
+LIBRARY_RECOMMENDATION_MIN_STUDENTS = 2
+LIBRARY_RECOMMENDATION_BATCH = 10000
+LIBRARY_RECOMMENDATION_LAG_SECONDS = 300